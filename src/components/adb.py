@@ -0,0 +1,83 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from typing import Optional
+import db
+
+# Upper bound on how many database calls run at once. It defaults to the
+# pool size so no worker ever waits on a connection. Password hashing has its
+# own process pool in the hashing module.
+DB_WORKERS = int(os.environ.get('HOTEL_DB_WORKERS', str(db.POOL_SIZE)))
+
+_db_executor: Optional[ThreadPoolExecutor] = None
+
+def configure(db_workers: Optional[int] = None):
+    """Sets the concurrency limit; the executor is recreated on next use."""
+    global DB_WORKERS
+    if db_workers is not None:
+        DB_WORKERS = db_workers
+    shutdown()
+
+def shutdown():
+    global _db_executor
+    if _db_executor is not None:
+        _db_executor.shutdown(wait=False)
+    _db_executor = None
+
+def _get_db_executor() -> ThreadPoolExecutor:
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix='db')
+    return _db_executor
+
+async def run(fn, *args, **kwargs):
+    """Runs a blocking database call on the database executor instead of the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_db_executor(), partial(fn, *args, **kwargs))
+
+def _async(fn):
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+    return wrapper
+
+# --- User Functions ---
+get_user_by_email = _async(db.get_user_by_email)
+create_user = _async(db.create_user)
+update_user_password = _async(db.update_user_password)
+set_user_admin = _async(db.set_user_admin)
+
+# --- Service Functions ---
+get_services = _async(db.get_services)
+get_service_by_id = _async(db.get_service_by_id)
+get_top_rated_services = _async(db.get_top_rated_services)
+update_service_status = _async(db.update_service_status)
+
+# --- Booking Functions ---
+create_booking = _async(db.create_booking)
+get_bookings = _async(db.get_bookings)
+update_booking_status = _async(db.update_booking_status)
+create_bookings_bulk = _async(db.create_bookings_bulk)
+update_booking_statuses_bulk = _async(db.update_booking_statuses_bulk)
+
+# --- Staff Functions ---
+create_staff = _async(db.create_staff)
+get_staff = _async(db.get_staff)
+
+# --- Room Functions ---
+create_room = _async(db.create_room)
+get_rooms = _async(db.get_rooms)
+update_room_status = _async(db.update_room_status)
+
+# --- Review Functions ---
+create_review = _async(db.create_review)
+get_reviews = _async(db.get_reviews)
+
+# --- Search Functions ---
+search = _async(db.search)
+
+# --- Analytics Functions ---
+get_revenue_data = _async(db.get_revenue_data)
+get_service_usage_data = _async(db.get_service_usage_data)
+get_occupancy_data = _async(db.get_occupancy_data)
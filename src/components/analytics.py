@@ -0,0 +1,290 @@
+import json
+import os
+import threading
+import time
+from datetime import date as Date, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+import db
+import events
+
+# Bookings are held as parallel NumPy columns ordered by booking id. New
+# bookings are appended by id and status changes are picked up from the
+# booking_updated events, so a query only reads the rows written since the
+# previous one. Writes made by other worker processes are picked up by the
+# periodic full reload.
+RELOAD_SECONDS = float(os.environ.get('HOTEL_ANALYTICS_RELOAD_SECONDS', '300'))
+
+GRANULARITIES = ('day', 'week', 'month')
+GROUPINGS = ('service', 'category')
+METRICS = ('revenue', 'bookings')
+MAX_ROLLING_WINDOW = 365
+
+STATUS_CODES = {status: code for code, status in enumerate(db.BOOKING_STATUSES)}
+COMPLETED = STATUS_CODES['completed']
+UNKNOWN = -1
+# Day number for dates that cannot be parsed; never inside a queried range
+NO_DAY = np.iinfo(np.int32).min
+# 1970-01-05, the first Monday on or after the datetime64 epoch
+FIRST_MONDAY = 4
+
+PALETTE = ['#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40']
+TITLES = {'day': 'Daily', 'week': 'Weekly', 'month': 'Monthly'}
+
+def _to_days(dates: Sequence[str]) -> np.ndarray:
+    """'YYYY-MM-DD' strings to days since 1970-01-01, NO_DAY where unparseable."""
+    try:
+        days = np.array(dates, dtype='datetime64[D]')
+    except ValueError:
+        days = np.empty(len(dates), dtype='datetime64[D]')
+        for i, value in enumerate(dates):
+            try:
+                days[i] = np.datetime64(value, 'D')
+            except ValueError:
+                days[i] = np.datetime64('NaT')
+    out = days.astype(np.int64)
+    out[np.isnat(days)] = NO_DAY
+    return out.astype(np.int32)
+
+def _day(value: str) -> int:
+    try:
+        return int(np.datetime64(Date.fromisoformat(value), 'D').astype(np.int64))
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+def _status_codes(statuses: Sequence[str]) -> np.ndarray:
+    return np.fromiter((STATUS_CODES.get(status, UNKNOWN) for status in statuses), dtype=np.int8, count=len(statuses))
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over up to `window` buckets (shorter at the start of the series)."""
+    sums = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+def _json_values(values: np.ndarray, digits: int = 2) -> List[Optional[float]]:
+    return [None if np.isnan(value) else value for value in np.round(values, digits).tolist()]
+
+class AnalyticsEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirty_lock = threading.Lock()
+        self._dirty = set()
+        self._size = 0
+        self._ids = np.empty(0, dtype=np.int64)
+        self._days = np.empty(0, dtype=np.int32)
+        self._services = np.empty(0, dtype=np.int32)
+        self._statuses = np.empty(0, dtype=np.int8)
+        self._max_id = 0
+        self._loaded_at = None
+        self._service_versions = None
+        self._prices = np.zeros(0)
+        self._categories = np.zeros(0, dtype=np.int32)
+        self._service_names: Dict[int, str] = {}
+        self._category_names: Dict[int, str] = {}
+        events.bus.listen(self._on_event)
+
+    def _on_event(self, topic: str, data: Dict[str, Any]):
+        if topic == 'booking_updated':
+            with self._dirty_lock:
+                self._dirty.add(data['id'])
+
+    # --- Loading ---
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        if needed <= len(self._ids):
+            return
+        capacity = max(needed, 2 * len(self._ids), 1024)
+        for name in ('_ids', '_days', '_services', '_statuses'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _append(self, rows: List[tuple]):
+        if not rows:
+            return
+        ids, dates, services, statuses = zip(*rows)
+        self._reserve(len(rows))
+        end = self._size + len(rows)
+        self._ids[self._size:end] = ids
+        self._days[self._size:end] = _to_days(dates)
+        self._services[self._size:end] = services
+        self._statuses[self._size:end] = _status_codes(statuses)
+        self._size = end
+        self._max_id = ids[-1]
+
+    def _load_services(self, conn):
+        rows = conn.execute('SELECT id, name, price, category_id FROM services').fetchall()
+        size = max([row['id'] for row in rows] + [0]) + 1
+        self._prices = np.zeros(size)
+        self._categories = np.zeros(size, dtype=np.int32)
+        for row in rows:
+            self._prices[row['id']] = row['price'] or 0.0
+            self._categories[row['id']] = row['category_id'] or 0
+        self._service_names = {row['id']: row['name'] for row in rows}
+        self._category_names = {row[0]: row[1] for row in conn.execute('SELECT id, name FROM service_categories')}
+        self._service_versions = db.table_versions('services')
+
+    def _refresh(self):
+        """Appends bookings newer than the last one seen and re-reads any that changed status."""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > RELOAD_SECONDS:
+            self._size = 0
+            self._max_id = 0
+            self._loaded_at = time.monotonic()
+            with self._dirty_lock:
+                self._dirty.clear()
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        with db.get_db() as conn:
+            if self._service_versions != db.table_versions('services') or self._size == 0:
+                self._load_services(conn)
+            # Archived bookings are history too; a booking archived since the
+            # last refresh is appended from the archive. Bookings without a
+            # service (room only) have no service revenue and are left out.
+            self._append(conn.execute('''
+                SELECT id, date, service_id, status FROM bookings WHERE id > ? AND service_id IS NOT NULL
+                UNION ALL
+                SELECT id, date, service_id, status FROM bookings_archive WHERE id > ? AND service_id IS NOT NULL
+                ORDER BY id
+            ''', (self._max_id, self._max_id)).fetchall())
+            if dirty:
+                ids = json.dumps(sorted(dirty))
+                changed = conn.execute('''
+                    SELECT id, date, service_id, status FROM bookings
+                    WHERE id IN (SELECT value FROM json_each(?)) AND service_id IS NOT NULL
+                    UNION ALL
+                    SELECT id, date, service_id, status FROM bookings_archive
+                    WHERE id IN (SELECT value FROM json_each(?)) AND service_id IS NOT NULL
+                    ORDER BY id
+                ''', (ids, ids)).fetchall()
+                if changed:
+                    self._update(changed)
+
+    def _update(self, rows: List[tuple]):
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        positions = np.searchsorted(self._ids[:self._size], ids)
+        found = positions < self._size
+        found[found] = self._ids[positions[found]] == ids[found]
+        positions = positions[found]
+        rows = [row for row, hit in zip(rows, found) if hit]
+        if not rows:
+            return
+        _, dates, services, statuses = zip(*rows)
+        self._days[positions] = _to_days(dates)
+        self._services[positions] = services
+        self._statuses[positions] = _status_codes(statuses)
+
+    # --- Queries ---
+    def _buckets(self, days: np.ndarray, start: int, end: int, granularity: str):
+        """Bucket index per day and the label of every bucket between start and end."""
+        if granularity == 'day':
+            labels = np.arange(start, end + 1).astype('datetime64[D]').astype(str)
+            return days - start, labels.tolist()
+        if granularity == 'week':
+            first, last = (start - FIRST_MONDAY) // 7, (end - FIRST_MONDAY) // 7
+            mondays = np.arange(first, last + 1) * 7 + FIRST_MONDAY
+            return (days - FIRST_MONDAY) // 7 - first, mondays.astype('datetime64[D]').astype(str).tolist()
+        months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        first, last = (np.array([start, end]).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64))
+        labels = np.arange(first, last + 1).astype('datetime64[M]').astype(str)
+        return months - first, labels.tolist()
+
+    def _groups(self, services: np.ndarray, group_by: Optional[str]):
+        """Dense group index per row and the name of every group."""
+        if group_by is None:
+            return np.zeros(len(services), dtype=np.int64), [None]
+        if group_by == 'service':
+            keys, names = services, self._service_names
+        else:
+            keys, names = self._categories[services], self._category_names
+        unique, index = np.unique(keys, return_inverse=True)
+        return index, [names.get(int(key), 'Uncategorized' if group_by == 'category' else f'Service {key}')
+                       for key in unique]
+
+    def series(self, metric: str, date_from: str, date_to: str, granularity: str = 'day',
+               group_by: Optional[str] = None, rolling: int = 0, percentiles: Sequence[float] = (),
+               deltas: bool = False) -> Dict[str, Any]:
+        """
+        Revenue (completed bookings at the service price) or booking counts per
+        day, week or month, optionally one dataset per service or category.
+        Returns the Chart.js payload plus a `summary` of totals, the change
+        against the preceding window of equal length, and percentiles of the
+        per-bucket totals.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        if group_by is not None and group_by not in GROUPINGS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+        if not 0 <= rolling <= MAX_ROLLING_WINDOW:
+            raise ValueError(f"rolling must be between 0 and {MAX_ROLLING_WINDOW}")
+        if any(not 0 <= pct <= 100 for pct in percentiles):
+            raise ValueError("percentiles must be between 0 and 100")
+        start, end = _day(date_from), _day(date_to)
+        if end < start:
+            raise ValueError("date_to is before date_from")
+
+        with self._lock:
+            self._refresh()
+            days = self._days[:self._size]
+            services = self._services[:self._size]
+            mask = services < len(self._prices)
+            if metric == 'revenue':
+                mask &= self._statuses[:self._size] == COMPLETED
+            weights = self._prices[np.where(mask, services, 0)] if metric == 'revenue' else np.ones(self._size)
+
+            previous_start = start - (end - start + 1)
+            previous_total = float(weights[mask & (days >= previous_start) & (days < start)].sum())
+
+            mask &= (days >= start) & (days <= end)
+            days, services, weights = days[mask], services[mask], weights[mask]
+            bucket, labels = self._buckets(days, start, end, granularity)
+            group, names = self._groups(services, group_by)
+
+        n_buckets, n_groups = len(labels), len(names)
+        totals = np.bincount(group * n_buckets + bucket, weights=weights,
+                             minlength=n_buckets * n_groups).reshape(n_groups, n_buckets)
+        totals = totals.astype(np.float64 if metric == 'revenue' else np.int64)
+        order = np.argsort(-totals.sum(axis=1), kind='stable')
+
+        title = TITLES[granularity]
+        datasets = []
+        for rank, g in enumerate(order):
+            name = names[g] or (f"{title} Revenue" if metric == 'revenue' else f"{title} Bookings")
+            color = PALETTE[rank % len(PALETTE)] if group_by else "rgba(75, 192, 192, 0.6)"
+            datasets.append({"label": name, "data": _json_values(totals[g]), "backgroundColor": color,
+                             "borderColor": color if group_by else "rgba(75, 192, 192, 1)", "borderWidth": 1})
+            if rolling:
+                datasets.append({"label": f"{name} ({rolling}-{granularity} average)", "type": "line",
+                                 "data": _json_values(rolling_mean(totals[g], rolling)),
+                                 "borderColor": color, "fill": False})
+            if deltas:
+                change = np.diff(totals[g], prepend=np.nan)
+                datasets.append({"label": f"{name} change", "type": "line", "data": _json_values(change),
+                                 "borderColor": color, "borderDash": [4, 4], "fill": False})
+
+        per_bucket = totals.sum(axis=0)
+        total = float(per_bucket.sum())
+        summary = {
+            "total": round(total, 2),
+            "previous_total": round(previous_total, 2),
+            "change": round(total / previous_total - 1, 4) if previous_total else None,
+        }
+        if percentiles:
+            values = np.percentile(per_bucket, percentiles) if n_buckets else np.zeros(len(percentiles))
+            summary["percentiles"] = {f"p{pct:g}": round(float(value), 2) for pct, value in zip(percentiles, values)}
+        return {"labels": labels, "datasets": datasets, "summary": summary}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"bookings_loaded": self._size, "max_booking_id": int(self._max_id)}
+
+engine = AnalyticsEngine()
+
+def window(days: int, date_from: Optional[str], date_to: Optional[str]):
+    """Resolves the query window: explicit dates, or the last `days` days up to today."""
+    date_to = date_to or Date.today().isoformat()
+    date_from = date_from or (Date.fromisoformat(date_to) - timedelta(days=days)).isoformat()
+    return date_from, date_to
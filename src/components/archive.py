@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import date, timedelta
+from typing import Dict, Optional
+import adb
+import db
+import metrics
+
+# Completed and cancelled bookings older than AFTER_DAYS are moved, with their
+# reviews, payments and products, into the <table>_archive tables, BATCH_SIZE
+# bookings per write transaction. The pause between batches lets the writes
+# queued by requests commit in between. Reads include the archive only when
+# their date range reaches back into it (see db.archive_overlaps). Archived
+# reviews drop out of full-text search, and archived bookings can no longer
+# be reviewed.
+AFTER_DAYS = int(os.environ.get('HOTEL_ARCHIVE_AFTER_DAYS', '365'))
+BATCH_SIZE = int(os.environ.get('HOTEL_ARCHIVE_BATCH_SIZE', '500'))
+BATCH_PAUSE = float(os.environ.get('HOTEL_ARCHIVE_BATCH_PAUSE_MS', '50')) / 1000
+INTERVAL_SECONDS = float(os.environ.get('HOTEL_ARCHIVE_INTERVAL_SECONDS', '3600'))
+
+ARCHIVED_ROWS = metrics.Counter('hotel_archived_rows_total', 'Rows moved into the archive tables.', ('table',))
+
+log = logging.getLogger('hotel.archive')
+
+def cutoff(after_days: int = AFTER_DAYS, today: Optional[date] = None) -> str:
+    """The booking date before which completed and cancelled bookings are archived."""
+    return ((today or date.today()) - timedelta(days=after_days)).isoformat()
+
+def _record(moved: Dict[str, int], totals: Dict[str, int]):
+    for table, count in moved.items():
+        totals[table] = totals.get(table, 0) + count
+        if count:
+            ARCHIVED_ROWS.inc(count, table=table)
+
+def run_once(after_days: int = AFTER_DAYS, batch_size: int = BATCH_SIZE,
+             pause: float = BATCH_PAUSE) -> Dict[str, int]:
+    """Archives every eligible booking, batch by batch; returns the rows moved per table."""
+    before, totals = cutoff(after_days), {}
+    while True:
+        moved = db.archive_bookings_batch(before, batch_size)
+        _record(moved, totals)
+        if moved['bookings'] < batch_size:
+            return totals
+        time.sleep(pause)
+
+async def run_forever(interval: float = INTERVAL_SECONDS, after_days: int = AFTER_DAYS,
+                      batch_size: int = BATCH_SIZE, pause: float = BATCH_PAUSE):
+    """The background job started by the app: one archival pass every `interval` seconds."""
+    while True:
+        try:
+            before, totals = cutoff(after_days), {}
+            while True:
+                moved = await adb.run(db.archive_bookings_batch, before, batch_size)
+                _record(moved, totals)
+                if moved['bookings'] < batch_size:
+                    break
+                await asyncio.sleep(pause)
+            if totals.get('bookings'):
+                log.info("Archived %s", ', '.join(f"{count} {table}" for table, count in totals.items()))
+        except Exception:
+            log.exception("Archival pass failed")
+        await asyncio.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old completed and cancelled bookings into the archive tables.")
+    parser.add_argument('--db', default=db.DB_PATH, help="path to the SQLite database")
+    parser.add_argument('--after-days', type=int, default=AFTER_DAYS, help="archive bookings older than this")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="bookings moved per transaction")
+    args = parser.parse_args()
+
+    db.configure_pool(path=args.db)
+    try:
+        totals = run_once(args.after_days, args.batch_size)
+    finally:
+        db.close()
+    for table, count in totals.items():
+        print(f"{table}: {count} rows archived")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
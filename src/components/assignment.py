@@ -0,0 +1,164 @@
+import argparse
+import json
+import time
+from typing import Any, Dict
+import availability
+import db
+import events
+import metrics
+
+# Pending bookings without a staff member are assigned as one batch: they
+# are read with one query and placed in order of start time (greedy interval
+# scheduling), each on the free qualified staff member (staff_services) with
+# the least booked time in the range so far. Slots are taken in the
+# availability index while solving, so bookings made meanwhile cannot clash
+# with the batch, and every assignment commits in one transaction, checked
+# against the bookings table as it is written.
+ASSIGNED = metrics.Counter('hotel_staff_assignments_total', 'Bookings given a staff member by the assignment engine.')
+
+PENDING_SQL = '''
+    SELECT id, user_id, service_id, date, time FROM bookings
+    WHERE status = 'pending' AND staff_id IS NULL AND service_id IS NOT NULL AND date BETWEEN ? AND ?
+'''
+
+# Minutes each staff member is already booked for in the range
+LOAD_SQL = f'''
+    SELECT b.staff_id, SUM(COALESCE(s.duration_minutes, 60)) FROM bookings b
+    LEFT JOIN services s ON s.id = b.service_id
+    WHERE b.staff_id IS NOT NULL AND b.date BETWEEN ? AND ?
+    AND b.status IN ({','.join('?' * len(availability.ACTIVE_STATUSES))})
+    GROUP BY b.staff_id
+'''
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+def assign(date_from: str, date_to: str, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Assigns staff to the pending bookings dated date_from to date_to
+    (inclusive). Returns the assignments, the bookings left unassigned with
+    the reason, and the time spent loading, solving and committing. A dry run
+    solves the same batch and gives the slots back without writing.
+    """
+    try:
+        first, last = availability.day_number(date_from), availability.day_number(date_to)
+    except ValueError:
+        raise ValueError("Dates must be YYYY-MM-DD")
+    if first > last:
+        raise ValueError("date_from is after date_to")
+    engine = availability.engine
+    started = time.perf_counter()
+    with db.get_db() as conn:
+        pending = conn.execute(PENDING_SQL, (date_from, date_to)).fetchall()
+        load = {row[0]: row[1] for row in conn.execute(LOAD_SQL, (date_from, date_to, *availability.ACTIVE_STATUSES))}
+    loaded = time.perf_counter()
+
+    qualified = availability.qualified_staff(row['service_id'] for row in pending)
+    slots, unassigned = [], []
+    for row in pending:
+        try:
+            slots.append((availability.slot_start(row['date'], row['time']), row))
+        except ValueError:
+            unassigned.append({"booking_id": row['id'], "reason": "Invalid date or time"})
+    # Earliest start first; holds[i] is the slot taken for assignments[i]
+    slots.sort(key=lambda slot: (slot[0], slot[1]['id']))
+    assignments, holds = [], []
+    for _, row in slots:
+        for staff_id in sorted(engine.free_staff(row['service_id'], row['date'], row['time'],
+                                                 qualified.get(row['service_id'], ())),
+                               key=lambda staff_id: (load.get(staff_id, 0), staff_id)):
+            try:
+                hold = engine.reserve(None, staff_id, row['service_id'], row['date'], row['time'])
+            except availability.BookingConflict:
+                # Taken by a booking made since free_staff() looked
+                continue
+            start, end = hold.staff_slot
+            load[staff_id] = load.get(staff_id, 0) + (end - start)
+            assignments.append({"booking_id": row['id'], "user_id": row['user_id'], "staff_id": staff_id,
+                                "date": row['date'], "time": row['time']})
+            holds.append(hold)
+            break
+        else:
+            unassigned.append({"booking_id": row['id'], "reason": "No qualified staff member is free"})
+    solved = time.perf_counter()
+
+    services = {row['id']: row['service_id'] for row in pending}
+    applied = []
+    try:
+        if assignments and not dry_run:
+            def apply(conn):
+                # Bookings assigned or no longer pending since they were read are skipped
+                still_pending = {row[0] for row in conn.execute('''
+                    SELECT id FROM bookings WHERE id IN (SELECT value FROM json_each(?))
+                    AND status = 'pending' AND staff_id IS NULL
+                ''', (json.dumps([item['booking_id'] for item in assignments]),))}
+                rows = []
+                for item in assignments:
+                    if item['booking_id'] not in still_pending:
+                        continue
+                    # Slots taken by other workers are not in this process's index
+                    try:
+                        availability.check_conflicts(conn, None, item['staff_id'], services[item['booking_id']],
+                                                     item['date'], item['time'])
+                    except availability.BookingConflict:
+                        continue
+                    conn.execute('UPDATE bookings SET staff_id = ? WHERE id = ?', (item['staff_id'], item['booking_id']))
+                    rows.append(item)
+                return rows
+            applied = db.get_writer().execute(apply)
+    finally:
+        engine.replace_holds(holds, [item['booking_id'] for item in applied])
+    committed = time.perf_counter()
+
+    if not dry_run:
+        skipped = {item['booking_id'] for item in assignments} - {item['booking_id'] for item in applied}
+        unassigned += [{"booking_id": booking_id, "reason": "Changed while assigning"}
+                       for booking_id in sorted(skipped)]
+        ASSIGNED.inc(len(applied))
+        for item in applied:
+            events.publish('booking_updated', {"id": item['booking_id'], "user_id": item['user_id'],
+                                               "status": "pending", "staff_id": item['staff_id']})
+        assignments = applied
+    for item in assignments:
+        del item['user_id']
+    return {
+        "dry_run": dry_run,
+        "bookings": len(pending),
+        "assigned": len(assignments),
+        "assignments": assignments,
+        "unassigned": unassigned,
+        "staff_load_minutes": dict(sorted(load.items())),
+        "timing_ms": {
+            "load": _ms(loaded - started),
+            "solve": _ms(solved - loaded),
+            "commit": _ms(committed - solved),
+            "total": _ms(committed - started),
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Assign qualified, free staff to pending bookings.")
+    parser.add_argument('date_from', help="first booking date, YYYY-MM-DD")
+    parser.add_argument('date_to', help="last booking date, YYYY-MM-DD")
+    parser.add_argument('--db', default=db.DB_PATH, help="path to the SQLite database")
+    parser.add_argument('--dry-run', action='store_true', help="solve and report without writing")
+    args = parser.parse_args()
+
+    db.configure_pool(path=args.db)
+    try:
+        result = assign(args.date_from, args.date_to, dry_run=args.dry_run)
+    except ValueError as e:
+        print(e)
+        return 1
+    finally:
+        db.close()
+    for item in result["assignments"]:
+        print(f"booking {item['booking_id']} ({item['date']} {item['time']}): staff {item['staff_id']}")
+    for item in result["unassigned"]:
+        print(f"booking {item['booking_id']}: {item['reason']}")
+    print(f"{'Would assign' if args.dry_run else 'Assigned'} {result['assigned']} of {result['bookings']} "
+          f"pending bookings; timing (ms): {result['timing_ms']}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,354 @@
+import json
+import threading
+from bisect import bisect_left
+from datetime import date as Date
+from typing import Optional, List, Dict, Any, Iterable, Set
+import db
+
+# Bookings holding a room or staff member for their time slot.
+ACTIVE_STATUSES = ('pending', 'confirmed', 'completed')
+MINUTES_PER_DAY = 24 * 60
+
+class BookingConflict(Exception):
+    """Raised when a room or staff member is already booked for an overlapping slot."""
+
+    def __init__(self, resource: str, booking_id: Optional[int]):
+        super().__init__(f"The {resource} is already booked for this time" +
+                         (f" (booking {booking_id})" if booking_id else ""))
+        self.resource = resource
+        self.booking_id = booking_id
+
+class Hold:
+    """A slot taken in the index; booking_id is filled in once the booking row exists."""
+
+    __slots__ = ('booking_id', 'room_id', 'staff_id', 'room_slot', 'staff_slot')
+
+    def __init__(self, booking_id: Optional[int], room_id: Optional[int], staff_id: Optional[int],
+                 room_slot: Optional[tuple], staff_slot: Optional[tuple]):
+        self.booking_id = booking_id
+        self.room_id = room_id
+        self.staff_id = staff_id
+        self.room_slot = room_slot
+        self.staff_slot = staff_slot
+
+def day_number(date: str) -> int:
+    return Date.fromisoformat(date).toordinal()
+
+def slot_start(date: str, time: Optional[str]) -> int:
+    """Minutes since the ordinal epoch for a 'YYYY-MM-DD' date and 'HH:MM' time."""
+    minutes = 0
+    if time:
+        hours, _, rest = time.partition(':')
+        minutes = int(hours) * 60 + int(rest[:2] or 0)
+    return day_number(date) * MINUTES_PER_DAY + minutes
+
+class IntervalIndex:
+    """
+    The half-open [start, end) intervals booked on one resource, kept sorted
+    by start. Because no interval is longer than `max_length`, an overlap
+    query is a bisect plus a scan of the few intervals starting shortly
+    before the queried range, i.e. O(log n) for the usual case.
+    """
+
+    def __init__(self):
+        self._starts: List[int] = []
+        self._entries: List[tuple] = []
+        self.max_length = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def find_overlap(self, start: int, end: int) -> Optional[Hold]:
+        i = bisect_left(self._starts, end) - 1
+        while i >= 0 and self._starts[i] > start - self.max_length:
+            if self._entries[i][1] > start:
+                return self._entries[i][2]
+            i -= 1
+        return None
+
+    def add(self, start: int, end: int, hold: Hold):
+        i = bisect_left(self._starts, start)
+        self._starts.insert(i, start)
+        self._entries.insert(i, (start, end, hold))
+        self.max_length = max(self.max_length, end - start)
+
+    def remove(self, start: int, hold: Hold):
+        i = bisect_left(self._starts, start)
+        while i < len(self._starts) and self._starts[i] == start:
+            if self._entries[i][2] is hold:
+                del self._starts[i]
+                del self._entries[i]
+                return
+            i += 1
+
+# --- Authoritative check ---
+# The engine below is per process, so two workers can each find the same slot
+# free. check_conflicts() repeats the check against the bookings table inside
+# the write transaction that inserts the booking; BEGIN IMMEDIATE serializes
+# that against every other writer, whichever process it runs in.
+ROOM_CONFLICT_SQL = f'''
+    SELECT id FROM bookings
+    WHERE room_id = ? AND date < ? AND date >= date(?, '-' || ? || ' days')
+    AND date(date, '+' || MAX(COALESCE(nights, 1), 1) || ' days') > ?
+    AND status IN ({','.join('?' * len(ACTIVE_STATUSES))})
+    LIMIT 1
+'''
+
+STAFF_CANDIDATES_SQL = f'''
+    SELECT b.id, b.date, b.time, s.duration_minutes FROM bookings b
+    LEFT JOIN services s ON s.id = b.service_id
+    WHERE b.staff_id = ? AND b.date BETWEEN ? AND ?
+    AND b.status IN ({','.join('?' * len(ACTIVE_STATUSES))})
+'''
+
+def _slot(date: str, time: Optional[str], minutes: Optional[int]) -> tuple:
+    if not time:
+        start = day_number(date) * MINUTES_PER_DAY
+        return start, start + MINUTES_PER_DAY
+    start = slot_start(date, time)
+    return start, start + (minutes or 60)
+
+def check_conflicts(conn, room_id: Optional[int], staff_id: Optional[int], service_id: Optional[int],
+                    date: str, time: Optional[str], nights: Optional[int] = 1):
+    """
+    Raises BookingConflict if an active booking holds the room or staff member for an overlapping slot. Reads go through
+    idx_bookings_room_date and idx_bookings_staff_date.
+    """
+    if room_id:
+        nights = max(nights or 1, 1)
+        end = Date.fromordinal(day_number(date) + nights).isoformat()
+        # No stay in the room is longer than its longest one (idx_bookings_room_nights)
+        longest = conn.execute('SELECT MAX(nights) FROM bookings WHERE room_id = ?', (room_id,)).fetchone()[0]
+        reach = max(longest or 1, 1)
+        clash = conn.execute(ROOM_CONFLICT_SQL, (room_id, end, date, reach, date, *ACTIVE_STATUSES)).fetchone()
+        if clash:
+            raise BookingConflict("room", clash[0])
+    if staff_id:
+        minutes = conn.execute('SELECT duration_minutes FROM services WHERE id = ?', (service_id,)).fetchone()
+        start, end = _slot(date, time, minutes[0] if minutes else None)
+        # No booking is longer than the longest service, or a whole day without a time
+        longest = conn.execute('SELECT MAX(duration_minutes) FROM services').fetchone()[0] or 0
+        reach = max(longest, MINUTES_PER_DAY)
+        first = Date.fromordinal((start - reach) // MINUTES_PER_DAY).isoformat()
+        last = Date.fromordinal((end - 1) // MINUTES_PER_DAY).isoformat()
+        for row in conn.execute(STAFF_CANDIDATES_SQL, (staff_id, first, last, *ACTIVE_STATUSES)):
+            try:
+                other_start, other_end = _slot(row[1], row[2], row[3])
+            except ValueError:
+                # Rows with an unparseable date or time cannot be placed on the timeline
+                continue
+            if other_start < end and other_end > start:
+                raise BookingConflict("staff member", row[0])
+
+def qualified_staff(service_ids: Optional[Iterable[int]] = None) -> Dict[int, Set[int]]:
+    """
+    Staff ids per service from staff_services. Not cached: the table is
+    maintained outside the app, so no write path could invalidate a copy.
+    """
+    query, params = 'SELECT staff_id, service_id FROM staff_services', ()
+    if service_ids is not None:
+        query += ' WHERE service_id IN (SELECT value FROM json_each(?))'
+        params = (json.dumps(sorted(set(service_ids))),)
+    service_staff: Dict[int, Set[int]] = {}
+    with db.get_db() as conn:
+        for staff_id, service_id in conn.execute(query, params):
+            service_staff.setdefault(service_id, set()).add(staff_id)
+    return service_staff
+
+class AvailabilityEngine:
+    """
+    Per-room and per-staff interval indexes over the active bookings, loaded
+    once from the database and kept current by the booking write paths.
+    Room bookings occupy whole nights; staff bookings occupy the service's
+    duration from the booking time. The indexes live in process memory and
+    only see this process's writes, so they serve as a fast pre-check in
+    front of check_conflicts().
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._rooms: Dict[int, IntervalIndex] = {}
+        self._staff: Dict[int, IntervalIndex] = {}
+        self._holds: Dict[int, Hold] = {}
+        self._room_info: Dict[int, Dict[str, Any]] = {}
+        self._service_minutes: Dict[int, int] = {}
+        self._metadata_versions = None
+
+    # --- Loading ---
+    def load(self):
+        with self._lock:
+            self._rooms.clear()
+            self._staff.clear()
+            self._holds.clear()
+            self._refresh_metadata(force=True)
+            with db.get_db() as conn:
+                rows = conn.execute(f'''
+                    SELECT id, room_id, staff_id, service_id, date, time, nights FROM bookings
+                    WHERE (room_id IS NOT NULL OR staff_id IS NOT NULL)
+                    AND status IN ({','.join('?' * len(ACTIVE_STATUSES))})
+                ''', ACTIVE_STATUSES).fetchall()
+            for row in rows:
+                try:
+                    self._index(row['id'], row['room_id'], row['staff_id'], row['service_id'],
+                                row['date'], row['time'], row['nights'])
+                except ValueError:
+                    # Rows with an unparseable date or time cannot be placed on the timeline
+                    continue
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+        else:
+            self._refresh_metadata()
+
+    def _refresh_metadata(self, force: bool = False):
+        versions = db.table_versions('rooms', 'services')
+        if not force and versions == self._metadata_versions:
+            return
+        with db.get_db() as conn:
+            self._room_info = {row['id']: dict(row) for row in conn.execute(
+                'SELECT id, room_number, type, price_per_night, status FROM rooms')}
+            self._service_minutes = {row[0]: row[1] for row in conn.execute(
+                'SELECT id, duration_minutes FROM services')}
+        self._metadata_versions = versions
+
+    # --- Slots ---
+    def _room_slot(self, date: str, nights: Optional[int]) -> tuple:
+        start = day_number(date) * MINUTES_PER_DAY
+        return start, start + max(nights or 1, 1) * MINUTES_PER_DAY
+
+    def _staff_slot(self, service_id: Optional[int], date: str, time: Optional[str]) -> tuple:
+        return _slot(date, time, self._service_minutes.get(service_id))
+
+    def _index(self, booking_id, room_id, staff_id, service_id, date, time, nights) -> Hold:
+        room_slot = self._room_slot(date, nights) if room_id else None
+        staff_slot = self._staff_slot(service_id, date, time) if staff_id else None
+        hold = Hold(booking_id, room_id, staff_id, room_slot, staff_slot)
+        if room_id:
+            self._rooms.setdefault(room_id, IntervalIndex()).add(*room_slot, hold)
+        if staff_id:
+            self._staff.setdefault(staff_id, IntervalIndex()).add(*staff_slot, hold)
+        if booking_id is not None:
+            self._holds[booking_id] = hold
+        return hold
+
+    # --- Writes ---
+    def reserve(self, room_id: Optional[int], staff_id: Optional[int], service_id: Optional[int],
+                date: str, time: Optional[str], nights: Optional[int] = 1) -> Hold:
+        """
+        Checks the room and staff member for conflicts and takes the slot.
+        The caller attaches the booking id with confirm(), or gives the slot
+        back with release() if the booking could not be written.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if room_id:
+                clash = self._rooms.get(room_id, IntervalIndex()).find_overlap(*self._room_slot(date, nights))
+                if clash:
+                    raise BookingConflict("room", clash.booking_id)
+            if staff_id:
+                clash = self._staff.get(staff_id, IntervalIndex()).find_overlap(
+                    *self._staff_slot(service_id, date, time))
+                if clash:
+                    raise BookingConflict("staff member", clash.booking_id)
+            return self._index(None, room_id, staff_id, service_id, date, time, nights)
+
+    def confirm(self, hold: Hold, booking_id: int):
+        with self._lock:
+            hold.booking_id = booking_id
+            self._holds[booking_id] = hold
+
+    def release(self, hold: Hold):
+        with self._lock:
+            if hold.room_id and hold.room_id in self._rooms:
+                self._rooms[hold.room_id].remove(hold.room_slot[0], hold)
+            if hold.staff_id and hold.staff_id in self._staff:
+                self._staff[hold.staff_id].remove(hold.staff_slot[0], hold)
+            if hold.booking_id is not None:
+                self._holds.pop(hold.booking_id, None)
+
+    def replace_holds(self, holds: Iterable[Hold], booking_ids: Iterable[int]):
+        """
+        Gives back holds taken on behalf of existing bookings and indexes those
+        bookings from the database instead, in one step so that no other
+        reservation can take the slots in between.
+        """
+        with self._lock:
+            for hold in holds:
+                self.release(hold)
+            self.refresh_bookings(booking_ids)
+
+    def refresh_bookings(self, booking_ids: Iterable[int]):
+        """Re-indexes bookings whose status, room or staff member changed."""
+        booking_ids = list(booking_ids)
+        with self._lock:
+            if not self._loaded:
+                return
+            for booking_id in booking_ids:
+                hold = self._holds.get(booking_id)
+                if hold:
+                    self.release(hold)
+            with db.get_db() as conn:
+                rows = conn.execute(f'''
+                    SELECT id, room_id, staff_id, service_id, date, time, nights FROM bookings
+                    WHERE id IN (SELECT value FROM json_each(?))
+                    AND (room_id IS NOT NULL OR staff_id IS NOT NULL)
+                    AND status IN ({','.join('?' * len(ACTIVE_STATUSES))})
+                ''', (json.dumps(booking_ids), *ACTIVE_STATUSES)).fetchall()
+            for row in rows:
+                try:
+                    self._index(row['id'], row['room_id'], row['staff_id'], row['service_id'],
+                                row['date'], row['time'], row['nights'])
+                except ValueError:
+                    # Rows with an unparseable date or time cannot be placed on the timeline
+                    continue
+
+    # --- Queries ---
+    def free_rooms(self, check_in: str, nights: int = 1, room_type: Optional[str] = None,
+                   min_price: Optional[float] = None, max_price: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Rooms not in maintenance and without a booking overlapping the requested nights."""
+        with self._lock:
+            self._ensure_loaded()
+            start, end = self._room_slot(check_in, nights)
+            free = []
+            for room_id, room in self._room_info.items():
+                if room['status'] == 'maintenance':
+                    continue
+                if room_type and room['type'] != room_type:
+                    continue
+                if min_price is not None and room['price_per_night'] < min_price:
+                    continue
+                if max_price is not None and room['price_per_night'] > max_price:
+                    continue
+                index = self._rooms.get(room_id)
+                if index is None or index.find_overlap(start, end) is None:
+                    free.append(room)
+            return sorted(free, key=lambda room: room['price_per_night'])
+
+    def free_staff(self, service_id: int, date: str, time: Optional[str],
+                   qualified: Optional[Iterable[int]] = None) -> List[int]:
+        """
+        Ids of staff qualified for the service who are free for its slot.
+        Qualifications are read from staff_services unless passed in.
+        """
+        if qualified is None:
+            qualified = qualified_staff([service_id]).get(service_id, ())
+        with self._lock:
+            self._ensure_loaded()
+            start, end = self._staff_slot(service_id, date, time)
+            return sorted(
+                staff_id for staff_id in qualified
+                if staff_id not in self._staff or self._staff[staff_id].find_overlap(start, end) is None
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "rooms_indexed": len(self._rooms),
+                "staff_indexed": len(self._staff),
+                "bookings_indexed": len(self._holds),
+            }
+
+engine = AvailabilityEngine()
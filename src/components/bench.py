@@ -0,0 +1,273 @@
+"""
+Load and latency benchmarks for the FastAPI app.
+
+Seed a synthetic database, then drive every router in-process and record
+throughput and p50/p95/p99 latency per endpoint:
+
+    python bench.py seed --db bench.sqlite --bookings 100000 --users 10000 --reviews 20000
+    python bench.py run --db bench.sqlite --concurrency 16 --requests 500 --save baseline.json
+    python bench.py run --db bench.sqlite --compare baseline.json
+
+Results are written as JSON so runs can be compared against a saved baseline.
+Each run works on a temporary copy of the seeded database, so the bookings
+created by the write scenarios do not carry over into the next run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Dict, Any, List, Tuple
+import db
+import hashing
+
+BENCH_PASSWORD = "benchpass"
+CHUNK_SIZE = 50_000
+STATUSES = ('pending', 'confirmed', 'completed', 'completed', 'cancelled')
+
+# --- Seeding ---
+def _chunks(total: int, make_row):
+    batch = []
+    for i in range(total):
+        batch.append(make_row(i))
+        if len(batch) == CHUNK_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def seed(path: str, bookings: int, users: int, reviews: int, days: int = 730, rng_seed: int = 42):
+    """Creates a fresh database at `path` filled with deterministic synthetic data."""
+    if os.path.exists(path):
+        os.remove(path)
+    db.configure_pool(path=path)
+    db.initialize_db()
+    rng = random.Random(rng_seed)
+
+    password_hash = hashing.hash_password_sync(BENCH_PASSWORD)
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    try:
+        for batch in _chunks(users, lambda i: (f'user{i}@bench.test', password_hash, f'Bench User {i}')):
+            conn.executemany('INSERT INTO users (email, password, full_name) VALUES (?, ?, ?)', batch)
+        conn.executemany('INSERT INTO rooms (room_number, type, price_per_night) VALUES (?, ?, ?)',
+                         [(f'B{n}', rng.choice(['Standard Single', 'Standard Double', 'Deluxe Suite']),
+                           rng.choice([100.0, 150.0, 250.0])) for n in range(100)])
+        conn.executemany('INSERT OR IGNORE INTO staff_services (staff_id, service_id) VALUES (?, ?)',
+                         [(staff_id, service_id) for staff_id in (1, 2) for service_id in (1, 2, 3, 4)])
+        user_ids = [row[0] for row in conn.execute('SELECT id FROM users')]
+        service_ids = [row[0] for row in conn.execute('SELECT id FROM services')]
+        today = date.today()
+
+        def booking_row(_):
+            day = today - timedelta(days=rng.randrange(days))
+            return (rng.choice(user_ids), rng.choice(service_ids), day.isoformat(),
+                    f'{rng.randrange(8, 20):02d}:{rng.choice(["00", "30"])}', rng.choice(STATUSES))
+        for batch in _chunks(bookings, booking_row):
+            conn.executemany('INSERT INTO bookings (user_id, service_id, date, time, status) VALUES (?, ?, ?, ?, ?)', batch)
+        conn.commit()
+
+        max_booking = conn.execute('SELECT MAX(id) FROM bookings').fetchone()[0] or 0
+        if max_booking:
+            def review_row(_):
+                created = today - timedelta(days=rng.randrange(days), seconds=rng.randrange(86400))
+                return (rng.randint(1, max_booking), rng.choice(user_ids), rng.randint(1, 5),
+                        rng.choice(['Great service', 'Would come again', 'Too slow', 'Lovely staff', None]),
+                        created.isoformat() + ' ' + time.strftime('%H:%M:%S', time.gmtime(rng.randrange(86400))))
+            for batch in _chunks(reviews, review_row):
+                conn.executemany('INSERT INTO reviews (booking_id, user_id, rating, comment, created_at) VALUES (?, ?, ?, ?, ?)', batch)
+        conn.execute('ANALYZE')
+        conn.commit()
+    finally:
+        conn.close()
+    db.configure_pool(path=path)
+
+# --- Load Generation ---
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def _scenarios(admin: Dict[str, str], customer: Dict[str, str]) -> List[Tuple[str, str, str, Dict[str, str], Any]]:
+    """(name, method, path, headers, json body) for every router."""
+    soon = (date.today() + timedelta(days=30)).isoformat()
+    return [
+        ("GET /services", "GET", "/services/", {}, None),
+        ("GET /reviews", "GET", "/reviews/", {}, None),
+        ("GET /bookings (admin)", "GET", "/bookings/", admin, None),
+        ("GET /bookings (customer)", "GET", "/bookings/", customer, None),
+        ("POST /bookings", "POST", "/bookings/", customer, {"service_id": 1, "date": soon, "time": "10:00"}),
+        ("GET /rooms", "GET", "/rooms/", admin, None),
+        ("GET /staff", "GET", "/staff/", admin, None),
+        ("GET /availability/rooms", "GET", f"/availability/rooms?check_in={soon}&nights=2", customer, None),
+        ("GET /analytics/revenue", "GET", "/analytics/revenue?days=30", admin, None),
+        ("GET /analytics/services", "GET", "/analytics/services?days=30", admin, None),
+        ("GET /analytics/occupancy", "GET", "/analytics/occupancy", admin, None),
+    ]
+
+async def _drive(client, method: str, path: str, headers, body, requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await client.request(method, path, headers=headers, json=body)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": requests / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "p99_ms": _percentile(latencies, 99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+    }
+
+def _fresh_copy(path: str) -> str:
+    """Copies the seeded database (WAL included) to a temporary file and returns its path."""
+    fd, copy = tempfile.mkstemp(suffix='.sqlite', prefix='bench-')
+    os.close(fd)
+    source, target = sqlite3.connect(path), sqlite3.connect(copy)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    return copy
+
+async def run(db_path: str, requests: int, concurrency: int, warmup: int = 10) -> Dict[str, Any]:
+    """
+    Drives every scenario against a fresh copy of the seeded database, so
+    the write scenarios never grow the seeded file and repeated runs stay
+    comparable with a saved baseline.
+    """
+    copy = _fresh_copy(db_path)
+    try:
+        return await _run(copy, requests, concurrency, warmup)
+    finally:
+        db.configure_pool(path=db_path)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(copy + suffix):
+                os.remove(copy + suffix)
+
+async def _run(db_path: str, requests: int, concurrency: int, warmup: int) -> Dict[str, Any]:
+    import httpx
+    import fast
+    from settings import Settings
+
+    # rate limits would throttle the load generator itself
+    app = fast.create_app(Settings(db_path=db_path, rate_limit=False, archive=False))
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport does not send lifespan events, so run the startup hook here
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def bearer(email, password):
+            response = await client.post("/token", auth=(email, password))
+            response.raise_for_status()
+            return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        admin = await bearer("admin@gmail.com", "adminpass")
+        customer = await bearer("user0@bench.test", BENCH_PASSWORD)
+        results = {}
+        for name, method, path, headers, body in _scenarios(admin, customer):
+            if warmup:
+                await _drive(client, method, path, headers, body, warmup, 1)
+            results[name] = await _drive(client, method, path, headers, body, requests, concurrency)
+            print(f"{name:<28} {results[name]['throughput_rps']:>9.1f} rps  "
+                  f"p50 {results[name]['p50_ms']:>7.2f}  p95 {results[name]['p95_ms']:>7.2f}  "
+                  f"p99 {results[name]['p99_ms']:>7.2f} ms  errors {results[name]['errors']}")
+    return results
+
+def _table_sizes() -> Dict[str, int]:
+    with db.get_db() as conn:
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('users', 'bookings', 'reviews')}
+
+# --- Baselines ---
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Lists endpoints whose p95 latency grew by more than `tolerance` (a fraction) over the baseline."""
+    regressions = []
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if not previous or not previous["p95_ms"]:
+            continue
+        change = result["p95_ms"] / previous["p95_ms"] - 1
+        print(f"{name:<28} p95 {previous['p95_ms']:>7.2f} -> {result['p95_ms']:>7.2f} ms ({change:+.1%})")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hotel management API.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = sub.add_parser('seed', help="create a synthetic database")
+    seed_parser.add_argument('--db', default='bench.sqlite')
+    seed_parser.add_argument('--bookings', type=int, default=10_000)
+    seed_parser.add_argument('--users', type=int, default=1_000)
+    seed_parser.add_argument('--reviews', type=int, default=2_000)
+    seed_parser.add_argument('--seed', type=int, default=42)
+
+    run_parser = sub.add_parser('run', help="drive every router and report latencies")
+    run_parser.add_argument('--db', default='bench.sqlite')
+    run_parser.add_argument('--requests', type=int, default=200, help="requests per endpoint")
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--save', help="write the results to this JSON file")
+    run_parser.add_argument('--compare', help="compare against a saved JSON baseline")
+    run_parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="allowed p95 regression as a fraction (default 0.2)")
+    args = parser.parse_args()
+
+    if args.command == 'seed':
+        started = time.perf_counter()
+        seed(args.db, args.bookings, args.users, args.reviews, rng_seed=args.seed)
+        print(f"Seeded {args.db} in {time.perf_counter() - started:.1f}s")
+        return 0
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist; run 'bench.py seed' first")
+    results = asyncio.run(run(args.db, args.requests, args.concurrency))
+    report = {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "tables": _table_sizes(),
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
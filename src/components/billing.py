@@ -0,0 +1,166 @@
+import argparse
+import json
+import sqlite3
+from datetime import date
+from typing import Any, Dict, List, Optional
+import db
+import metrics
+
+# Invoices are computed for a whole set of bookings at once: one query for
+# the per-booking totals and one for the product lines, however many
+# bookings there are. A billing run adds one payments row per invoice and
+# takes the products off stock in the same write transaction. Bookings that
+# already have a payment are never billed again.
+INVOICE_SQL = '''
+    WITH selected (id) AS (SELECT value FROM json_each(?)),
+    product_totals AS (
+        SELECT bp.booking_id, SUM(bp.quantity * p.price) AS amount
+        FROM booking_products bp JOIN products p ON p.id = bp.product_id
+        WHERE bp.booking_id IN selected
+        GROUP BY bp.booking_id
+    )
+    SELECT b.id AS booking_id, b.user_id,
+           COALESCE(s.price, 0) AS service_amount,
+           COALESCE(b.nights * r.price_per_night, 0) AS room_amount,
+           COALESCE(pt.amount, 0) AS products_amount,
+           ROUND(COALESCE(s.price, 0) + COALESCE(b.nights * r.price_per_night, 0) + COALESCE(pt.amount, 0), 2) AS total
+    FROM bookings b
+    LEFT JOIN services s ON s.id = b.service_id
+    LEFT JOIN rooms r ON r.id = b.room_id
+    LEFT JOIN product_totals pt ON pt.booking_id = b.id
+    WHERE b.id IN selected
+    ORDER BY b.id
+'''
+
+LINES_SQL = '''
+    SELECT bp.booking_id, bp.product_id, p.name, bp.quantity, p.price AS unit_price,
+           ROUND(bp.quantity * p.price, 2) AS amount
+    FROM booking_products bp JOIN products p ON p.id = bp.product_id
+    WHERE bp.booking_id IN (SELECT value FROM json_each(?))
+    ORDER BY bp.booking_id, bp.product_id
+'''
+
+# How much of each product a set of bookings takes off stock, next to its current stock
+STOCK_SQL = '''
+    SELECT p.id, p.name, COALESCE(p.stock, 0) AS stock, SUM(bp.quantity) AS quantity
+    FROM booking_products bp JOIN products p ON p.id = bp.product_id
+    WHERE bp.booking_id IN (SELECT value FROM json_each(?))
+    GROUP BY p.id
+'''
+
+BILLED_BOOKINGS = metrics.Counter('hotel_billed_bookings_total', 'Bookings invoiced by billing runs.')
+
+class InsufficientStock(Exception):
+    """Raised when a billing run would take more of a product than is in stock."""
+
+    def __init__(self, shortages: List[Dict[str, Any]]):
+        self.shortages = shortages
+        super().__init__("Not enough stock for " + ', '.join(
+            f"{item['name']} ({item['quantity']} needed, {item['stock']} in stock)" for item in shortages))
+
+def _unbilled(conn: sqlite3.Connection, booking_ids: Optional[List[int]], date_from: Optional[str],
+              date_to: Optional[str], status: Optional[str]) -> List[int]:
+    """Ids of the selected bookings that have no payment yet."""
+    conditions, params = ['NOT EXISTS (SELECT 1 FROM payments p WHERE p.booking_id = b.id)'], []
+    if booking_ids is not None:
+        conditions.append('b.id IN (SELECT value FROM json_each(?))')
+        params.append(json.dumps(booking_ids))
+    if date_from:
+        conditions.append('b.date >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append('b.date <= ?')
+        params.append(date_to)
+    if status:
+        conditions.append('b.status = ?')
+        params.append(status)
+    return [row[0] for row in conn.execute(
+        'SELECT b.id FROM bookings b WHERE ' + ' AND '.join(conditions) + ' ORDER BY b.id', params)]
+
+def _invoices(conn: sqlite3.Connection, booking_ids: List[int]) -> List[Dict[str, Any]]:
+    ids = json.dumps(booking_ids)
+    invoices = [dict(row) for row in conn.execute(INVOICE_SQL, (ids,))]
+    lines: Dict[int, List[Dict[str, Any]]] = {}
+    for row in conn.execute(LINES_SQL, (ids,)):
+        line = dict(row)
+        lines.setdefault(line.pop('booking_id'), []).append(line)
+    for invoice in invoices:
+        invoice['products'] = lines.get(invoice['booking_id'], [])
+    return invoices
+
+def invoices(booking_ids: List[int]) -> List[Dict[str, Any]]:
+    """Invoices for the given bookings, whether or not they were billed already."""
+    with db.get_db() as conn:
+        return _invoices(conn, booking_ids)
+
+def run(booking_ids: Optional[List[int]] = None, date_from: Optional[str] = None,
+        date_to: Optional[str] = None, status: Optional[str] = 'completed',
+        payment_date: Optional[str] = None, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Bills every selected booking (by id and/or booking date range, and by
+    status) that has no payment yet: one payments row per invoice and the
+    product quantities taken off stock, all in one transaction. Raises
+    InsufficientStock, billing nothing, if any product would go below zero.
+    A dry run computes the same invoices without writing.
+    """
+    if booking_ids is None and not (date_from or date_to):
+        raise ValueError("Select bookings by id or by date range")
+    payment_date = payment_date or date.today().isoformat()
+
+    def bill(conn):
+        ids = _unbilled(conn, booking_ids, date_from, date_to, status)
+        billed = _invoices(conn, ids)
+        shortages = [dict(row) for row in conn.execute(STOCK_SQL, (json.dumps(ids),))
+                     if row['quantity'] > row['stock']]
+        if shortages:
+            raise InsufficientStock(shortages)
+        if not dry_run:
+            conn.executemany("INSERT INTO payments (booking_id, amount, payment_date, status) VALUES (?, ?, ?, 'completed')",
+                             [(invoice['booking_id'], invoice['total'], payment_date) for invoice in billed])
+            conn.execute('''
+                UPDATE products SET stock = COALESCE(stock, 0) - used.quantity
+                FROM (SELECT product_id, SUM(quantity) AS quantity FROM booking_products
+                      WHERE booking_id IN (SELECT value FROM json_each(?)) GROUP BY product_id) AS used
+                WHERE products.id = used.product_id
+            ''', (json.dumps(ids),))
+        return billed
+
+    if dry_run:
+        with db.get_db() as conn:
+            billed = bill(conn)
+    else:
+        billed = db.get_writer().execute(bill)
+        BILLED_BOOKINGS.inc(len(billed))
+    return {
+        "dry_run": dry_run,
+        "payment_date": payment_date,
+        "bookings": len(billed),
+        "total": round(sum(invoice['total'] for invoice in billed), 2),
+        "invoices": billed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Invoice bookings and record their payments.")
+    parser.add_argument('--db', default=db.DB_PATH, help="path to the SQLite database")
+    parser.add_argument('--booking', type=int, action='append', dest='booking_ids', help="booking id (repeatable)")
+    parser.add_argument('--date-from', help="first booking date to bill, YYYY-MM-DD")
+    parser.add_argument('--date-to', help="last booking date to bill, YYYY-MM-DD")
+    parser.add_argument('--status', default='completed', help="only bill bookings with this status")
+    parser.add_argument('--dry-run', action='store_true', help="print the invoices without writing")
+    args = parser.parse_args()
+
+    db.configure_pool(path=args.db)
+    try:
+        result = run(args.booking_ids, args.date_from, args.date_to, args.status or None, dry_run=args.dry_run)
+    except (ValueError, InsufficientStock) as e:
+        print(e)
+        return 1
+    finally:
+        db.close()
+    for invoice in result["invoices"]:
+        print(f"booking {invoice['booking_id']}: {invoice['total']:.2f}")
+    print(f"{'Would bill' if args.dry_run else 'Billed'} {result['bookings']} bookings, {result['total']:.2f} in total")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# Bounds for the in-process response cache. Writes in this process invalidate
+# entries immediately through the table versions in db; the TTL bounds how
+# long a response can stay stale after a write made by another worker.
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('HOTEL_RESPONSE_CACHE_ENTRIES', '512'))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('HOTEL_RESPONSE_CACHE_BYTES', str(32 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.environ.get('HOTEL_RESPONSE_CACHE_TTL', '10'))
+# Analytics read bookings, whose writes are not versioned, so the analytics
+# dashboard is shared between requests for this long only
+DASHBOARD_CACHE_TTL = float(os.environ.get('HOTEL_DASHBOARD_CACHE_TTL', '5'))
+
+class CachedResponse:
+    """An encoded response body with its ETag and any extra headers."""
+
+    __slots__ = ('body', 'etag', 'headers', 'expires_at')
+
+    def __init__(self, body: bytes, headers: Dict[str, str], ttl: float):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.headers = headers
+        self.expires_at = time.monotonic() + ttl if ttl else None
+
+class ResponseCache:
+    """A thread-safe LRU cache of encoded responses bounded by entry count and total size."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES, ttl: float = RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is not None and entry.expires_at < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, body: bytes, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        entry = CachedResponse(body, headers or {}, self.ttl)
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def _remove(self, key: Hashable):
+        self._size -= len(self._entries.pop(key).body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -1,157 +1,324 @@
 import sqlite3
 import os
-from typing import Optional, List, Dict, Any
+import base64
+import html
+import json
+import logging
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Tuple, Callable
 from datetime import datetime, timedelta
+import events
+import hashing
+import metrics
+import migrations
+import serialize
+import writer
 
+DB_PATH = os.environ.get('HOTEL_DB_PATH', 'db.sqlite')
+
+# --- Connection Pool Settings ---
+# Each value can be overridden from the environment or through configure_pool().
+POOL_SIZE = int(os.environ.get('HOTEL_DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = float(os.environ.get('HOTEL_DB_POOL_TIMEOUT', '30'))
+CACHE_SIZE_KIB = int(os.environ.get('HOTEL_DB_CACHE_SIZE_KIB', '16384'))
+MMAP_SIZE = int(os.environ.get('HOTEL_DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+CACHED_STATEMENTS = int(os.environ.get('HOTEL_DB_CACHED_STATEMENTS', '256'))
+
+# --- Booking Settings ---
+BOOKING_STATUSES = ('pending', 'confirmed', 'completed', 'cancelled')
+MAX_BULK_ITEMS = 1000
+
+# --- Pagination Settings ---
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# --- Query Instrumentation ---
+# Statements slower than HOTEL_SLOW_QUERY_MS are logged with their parameter
+# types and query plan; 0 (the default) turns the slow-query log off.
+SLOW_QUERY_MS = float(os.environ.get('HOTEL_SLOW_QUERY_MS', '0'))
+slow_query_log = logging.getLogger('hotel.slow_query')
+
+STATEMENT_SECONDS = metrics.Histogram(
+    'hotel_db_statement_seconds', 'Time spent executing SQL statements.', ('statement',))
+STATEMENT_ROWS = metrics.Counter(
+    'hotel_db_rows_returned_total', 'Rows fetched from SQL statements.', ('statement',))
+
+_WHITESPACE = re.compile(r'\s+')
+_statement_labels: Dict[str, str] = {}
+
+def _statement_label(sql: str) -> str:
+    label = _statement_labels.get(sql)
+    if label is None:
+        label = _WHITESPACE.sub(' ', sql).strip()[:120]
+        if len(_statement_labels) < 4096:
+            _statement_labels[sql] = label
+    return label
+
+def _log_slow_query(conn: sqlite3.Connection, sql: str, parameters, elapsed: float):
+    shape = ([type(p).__name__ for p in parameters] if isinstance(parameters, (list, tuple))
+             else {k: type(v).__name__ for k, v in parameters.items()})
+    plan = None
+    keyword = sql.split(None, 1)[0].upper() if sql.strip() else ''
+    if keyword in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE'):
+        try:
+            plan = [row[3] for row in sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters)]
+        except sqlite3.Error:
+            pass
+    slow_query_log.warning("slow query (%.1f ms): %s params=%s plan=%s",
+                           elapsed * 1000, _statement_label(sql), shape, plan)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Counts the rows fetched through the cursor against the statement that produced them."""
+
+    statement = ''
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            STATEMENT_ROWS.inc(statement=self.statement)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        STATEMENT_ROWS.inc(len(rows), statement=self.statement)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        STATEMENT_ROWS.inc(len(rows), statement=self.statement)
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        STATEMENT_ROWS.inc(statement=self.statement)
+        return row
+
+class InstrumentedConnection(sqlite3.Connection):
+    """A connection that times every statement run through execute() and executemany()."""
+
+    def _timed(self, method, sql: str, parameters, raw: bool = False):
+        cursor = self.cursor(InstrumentedCursor)
+        if raw:
+            cursor.row_factory = None
+        cursor.statement = _statement_label(sql)
+        started = time.perf_counter()
+        method(cursor, sql, parameters)
+        elapsed = time.perf_counter() - started
+        STATEMENT_SECONDS.observe(elapsed, statement=cursor.statement)
+        if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS and method is sqlite3.Cursor.execute:
+            _log_slow_query(self, sql, parameters, elapsed)
+        return cursor
+
+    def execute(self, sql: str, parameters=()):
+        return self._timed(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql: str, parameters):
+        return self._timed(sqlite3.Cursor.executemany, sql, parameters)
+
+    def execute_tuples(self, sql: str, parameters=()):
+        """execute() with a cursor that returns plain tuples instead of sqlite3.Row."""
+        return self._timed(sqlite3.Cursor.execute, sql, parameters, raw=True)
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection became free within the pool timeout."""
+
+class ConnectionPool:
+    """
+    A bounded pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to `size`, configured once with the
+    production PRAGMAs and then reused, so requests no longer pay for opening
+    a connection and loading the schema.
+    """
+
+    def __init__(self, path: str, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._all = []
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=CACHED_STATEMENTS, factory=InstrumentedConnection)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KIB}')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if len(self._all) < self.size:
+                    conn = self._connect()
+                    self._all.append(conn)
+                else:
+                    self.waits += 1
+            if conn is None:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                finally:
+                    with self._lock:
+                        self.wait_seconds += time.perf_counter() - started
+        with self._lock:
+            self.checkouts += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+            self._idle = queue.LifoQueue()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": len(self._all),
+                "idle": self._idle.qsize(),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_seconds": self.wait_seconds,
+            }
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+# The database file that initialize_db() last brought up to date
+_initialized_path: Optional[str] = None
+
+def configure_pool(path: Optional[str] = None, size: Optional[int] = None, timeout: Optional[float] = None,
+                   initialize: bool = True):
+    """
+    Replaces the connection pool, e.g. to point it at another database file.
+    With initialize=False the schema is taken as managed elsewhere, so the
+    pool does not run initialize_db() when it is first used.
+    """
+    global _pool, DB_PATH, POOL_SIZE, POOL_TIMEOUT, _initialized_path
+    with _pool_lock:
+        if path is not None:
+            DB_PATH = path
+        if not initialize:
+            _initialized_path = DB_PATH
+        if size is not None:
+            POOL_SIZE = size
+        if timeout is not None:
+            POOL_TIMEOUT = timeout
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+    close_writer()
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the process-wide pool. The app initializes the database in its
+    startup hook; scripts that skipped that get it here, once, on creation.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if _initialized_path != DB_PATH:
+                    initialize_db()
+                _pool = ConnectionPool(DB_PATH, POOL_SIZE, POOL_TIMEOUT)
+    return _pool
+
+def close():
+    """Commits queued writes and closes every pooled connection."""
+    global _pool
+    close_writer()
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def _pool_stats() -> Dict[str, Any]:
+    return _pool.stats() if _pool is not None else {}
+
+metrics.Gauge('hotel_db_pool_open_connections', 'Open pooled connections.',
+              lambda: _pool_stats().get('open', 0))
+metrics.Gauge('hotel_db_pool_idle_connections', 'Idle pooled connections.',
+              lambda: _pool_stats().get('idle', 0))
+metrics.Gauge('hotel_db_pool_checkouts_total', 'Connections checked out of the pool.',
+              lambda: _pool_stats().get('checkouts', 0), kind='counter')
+metrics.Gauge('hotel_db_pool_waits_total', 'Checkouts that had to wait for a free connection.',
+              lambda: _pool_stats().get('waits', 0), kind='counter')
+metrics.Gauge('hotel_db_pool_wait_seconds_total', 'Time spent waiting for a pooled connection.',
+              lambda: _pool_stats().get('wait_seconds', 0.0), kind='counter')
+
+@contextmanager
 def get_db():
-    """Establishes and returns a database connection."""
-    db_path = 'db.sqlite'
-    if not os.path.exists(db_path):
-        initialize_db()
-    
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Checks a database connection out of the pool and returns it when the block exits."""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+# --- Write Queue ---
+# Every write goes through one group-commit writer per process; see writer.py.
+_writer: Optional[writer.GroupCommitWriter] = None
+_writer_lock = threading.Lock()
+
+def get_writer() -> writer.GroupCommitWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = writer.GroupCommitWriter(get_pool()._connect)
+    return _writer
+
+def close_writer():
+    """Commits any queued writes and stops the writer thread."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+def _write(operation: writer.Operation) -> Any:
+    """Runs `operation(conn)` in the next group commit and returns its result once committed."""
+    return get_writer().execute(operation)
+
+metrics.Gauge('hotel_db_write_queue_depth', 'Writes waiting for the next group commit.',
+              lambda: _writer.pending() if _writer is not None else 0)
 
 def initialize_db():
-    """Initializes the database with a full schema and default data."""
-    conn = sqlite3.connect('db.sqlite')
+    """Brings the schema up to date through the migrations and inserts default data."""
+    global _initialized_path
+    conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
-    
-    # --- People & Roles ---
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            full_name TEXT NOT NULL,
-            is_admin BOOLEAN DEFAULT 0
-        )
-    ''')
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS customers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER UNIQUE NOT NULL,
-            phone_number TEXT,
-            address TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS staff (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            full_name TEXT NOT NULL,
-            specialty TEXT,
-            email TEXT UNIQUE,
-            phone_number TEXT
-        )
-    ''')
-
-    # --- Services & Products ---
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS service_categories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            description TEXT
-        )
-    ''')
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS services (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            category_id INTEGER,
-            name TEXT NOT NULL,
-            description TEXT,
-            price REAL NOT NULL,
-            status TEXT DEFAULT 'active',
-            FOREIGN KEY (category_id) REFERENCES service_categories (id)
-        )
-    ''')
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            price REAL NOT NULL,
-            stock INTEGER DEFAULT 0
-        )
-    ''')
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS staff_services (
-            staff_id INTEGER NOT NULL,
-            service_id INTEGER NOT NULL,
-            PRIMARY KEY (staff_id, service_id),
-            FOREIGN KEY (staff_id) REFERENCES staff (id),
-            FOREIGN KEY (service_id) REFERENCES services (id)
-        )
-    ''')
-
-    # --- Bookings & Hospitality ---
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS rooms (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            room_number TEXT UNIQUE NOT NULL,
-            type TEXT NOT NULL,
-            price_per_night REAL NOT NULL,
-            status TEXT DEFAULT 'available' -- available, occupied, maintenance
-        )
-    ''')
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS bookings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            service_id INTEGER,
-            room_id INTEGER,
-            staff_id INTEGER,
-            date TEXT NOT NULL,
-            time TEXT,
-            status TEXT NOT NULL, -- pending, confirmed, completed, cancelled
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (service_id) REFERENCES services (id),
-            FOREIGN KEY (room_id) REFERENCES rooms (id),
-            FOREIGN KEY (staff_id) REFERENCES staff (id)
-        )
-    ''')
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS booking_products (
-            booking_id INTEGER NOT NULL,
-            product_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL,
-            PRIMARY KEY (booking_id, product_id),
-            FOREIGN KEY (booking_id) REFERENCES bookings (id),
-            FOREIGN KEY (product_id) REFERENCES products (id)
-        )
-    ''')
-
-    # --- Financial & Feedback ---
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            booking_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            payment_date TEXT NOT NULL,
-            status TEXT DEFAULT 'completed',
-            FOREIGN KEY (booking_id) REFERENCES bookings (id)
-        )
-    ''')
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS reviews (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            booking_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            rating INTEGER NOT NULL,
-            comment TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (booking_id) REFERENCES bookings (id),
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # --- Insert Default Data ---
     try:
+        migrations.migrate(conn)
+
+        # --- Insert Default Data ---
         cur.execute("SELECT COUNT(*) FROM users WHERE email = 'admin@gmail.com'")
         if cur.fetchone()[0] == 0:
-            from passlib.context import CryptContext
-            pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-            hashed_password = pwd_context.hash("adminpass")
+            hashed_password = hashing.hash_password_sync("adminpass")
             cur.execute("INSERT INTO users (email, password, full_name, is_admin) VALUES (?, ?, ?, ?)",
                         ('admin@gmail.com', hashed_password, 'Admin User', 1))
 
@@ -182,173 +349,518 @@ def initialize_db():
                 ('201', 'Deluxe Suite', 250.0, 'maintenance')
             ])
 
+        cur.execute("INSERT OR IGNORE INTO app_secrets (name, value) VALUES ('token_secret', ?)",
+                    (secrets.token_hex(32),))
+
         conn.commit()
     finally:
         conn.close()
+    _initialized_path = DB_PATH
+
+# --- Table Versions ---
+# Bumped after every committed write to a table; cached responses built from
+# a table are keyed on its version, so a write invalidates them.
+_table_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+
+def table_versions(*tables: str) -> Tuple[int, ...]:
+    return tuple(_table_versions.get(table, 0) for table in tables)
+
+def _bump(*tables: str):
+    with _versions_lock:
+        for table in tables:
+            _table_versions[table] = _table_versions.get(table, 0) + 1
+
+# --- Pagination Helpers ---
+def _encode_cursor(*values) -> str:
+    """Packs the sort key of the last row on a page into an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode('ascii')
+
+def _decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("Invalid cursor")
+    # Only values SQLite can bind; bool is excluded although it is an int
+    if any(isinstance(value, bool) or not isinstance(value, (str, int, float)) for value in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+def _page(rows: serialize.Rows, limit: int, *key_columns: str) -> Dict[str, Any]:
+    """Turns `limit + 1` fetched rows into a page and the cursor for the next one."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows.slice(limit)
+        next_cursor = _encode_cursor(*(rows.value(-1, column) for column in key_columns))
+    return {"items": rows, "next_cursor": next_cursor}
+
+def _select(conn: InstrumentedConnection, query: str, params=()) -> serialize.Rows:
+    """Runs a read for a list endpoint, keeping the rows as plain tuples instead of sqlite3.Row."""
+    return serialize.Rows.from_cursor(conn.execute_tuples(query, params))
+
+# --- Archive Helpers ---
+# Old bookings and their rows live in <table>_archive (see archive.py). A read
+# adds the archive to its query only when its date range reaches back to the
+# newest archived row, and must run in the same snapshot as that check.
+def archive_overlaps(conn: sqlite3.Connection, table: str, date_from: Optional[str]) -> bool:
+    """Whether rows dated `date_from` or later may have been moved to the table's archive."""
+    row = conn.execute('SELECT horizon FROM archive_horizons WHERE table_name = ?', (table,)).fetchone()
+    return row is not None and (date_from is None or date_from <= row[0])
+
+def union_archive(query: str, params: list, archived: bool) -> Tuple[str, list]:
+    """Formats the `{archive}` table suffixes, adding the archive arm when it is needed."""
+    if not archived:
+        return query.format(archive=''), list(params)
+    return query.format(archive='') + ' UNION ALL ' + query.format(archive='_archive'), list(params) * 2
 
 # --- User Functions ---
 def get_user_by_email(email: str) -> Optional[dict]:
-    conn = get_db()
-    user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
-    conn.close()
+    with get_db() as conn:
+        user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
     return dict(user) if user else None
 
 def create_user(email: str, password_hash: str, full_name: str):
-    conn = get_db()
     try:
-        conn.execute('INSERT INTO users (email, password, full_name) VALUES (?, ?, ?)',
-                     (email, password_hash, full_name))
-        conn.commit()
+        _write(lambda conn: conn.execute('INSERT INTO users (email, password, full_name) VALUES (?, ?, ?)',
+                                         (email, password_hash, full_name)))
     except sqlite3.IntegrityError:
         raise ValueError("Email already exists")
-    finally:
-        conn.close()
+
+def update_user_password(user_id: int, password_hash: str) -> bool:
+    return _write(lambda conn: conn.execute(
+        'UPDATE users SET password = ? WHERE id = ?', (password_hash, user_id)).rowcount) > 0
+
+def set_user_admin(user_id: int, is_admin: bool) -> bool:
+    return _write(lambda conn: conn.execute(
+        'UPDATE users SET is_admin = ? WHERE id = ?', (int(is_admin), user_id)).rowcount) > 0
+
+def get_token_secret() -> str:
+    """The bearer token signing secret stored in app_secrets, created on first use."""
+    with get_db() as conn:
+        row = conn.execute("SELECT value FROM app_secrets WHERE name = 'token_secret'").fetchone()
+    if row is not None:
+        return row[0]
+    # Whichever worker inserts first wins; the others read its secret back
+    return _write(lambda conn: conn.execute('''
+        INSERT INTO app_secrets (name, value) VALUES ('token_secret', ?)
+        ON CONFLICT (name) DO UPDATE SET value = value RETURNING value
+    ''', (secrets.token_hex(32),)).fetchone()[0])
+
+def get_tokens_revoked_before(user_id: int) -> Optional[float]:
+    """The time before which the user's bearer tokens are rejected; None if there is no such user."""
+    with get_db() as conn:
+        row = conn.execute('SELECT tokens_revoked_before FROM users WHERE id = ?', (user_id,)).fetchone()
+    return row[0] if row else None
+
+def set_tokens_revoked_before(user_id: int, revoked_before: float) -> bool:
+    return _write(lambda conn: conn.execute(
+        'UPDATE users SET tokens_revoked_before = ? WHERE id = ?', (revoked_before, user_id)).rowcount) > 0
 
 # --- Service Functions ---
-def get_services(status: Optional[str] = None) -> List[Dict[str, Any]]:
-    conn = get_db()
-    query = 'SELECT s.*, sc.name as category_name FROM services s LEFT JOIN service_categories sc ON s.category_id = sc.id'
+# Rating aggregates are kept in service_ratings by triggers on `reviews` (see
+# migration 7); services are listed with their review count, average and
+# histogram (the number of 1 to 5 star reviews) inline.
+_SERVICE_RATINGS = '''
+    COALESCE(r.review_count, 0) AS review_count,
+    ROUND(CAST(r.rating_sum AS REAL) / r.review_count, 2) AS average_rating,
+    COALESCE(r.rating_1, 0), COALESCE(r.rating_2, 0), COALESCE(r.rating_3, 0),
+    COALESCE(r.rating_4, 0), COALESCE(r.rating_5, 0)
+'''
+
+def _with_histogram(rows: serialize.Rows) -> serialize.Rows:
+    """Folds the five trailing per-star counts of each row into a `rating_histogram` list."""
+    return serialize.Rows(rows.columns[:-5] + ('rating_histogram',),
+                          [row[:-5] + (list(row[-5:]),) for row in rows.rows])
+
+def get_services(status: Optional[str] = None) -> serialize.Rows:
+    query = f'''
+        SELECT s.*, sc.name as category_name, {_SERVICE_RATINGS}
+        FROM services s
+        LEFT JOIN service_categories sc ON s.category_id = sc.id
+        LEFT JOIN service_ratings r ON r.service_id = s.id
+    '''
     params = []
     if status:
         query += ' WHERE s.status = ?'
         params.append(status)
-    services = [dict(row) for row in conn.execute(query, params).fetchall()]
-    conn.close()
-    return services
+    with get_db() as conn:
+        return _with_histogram(_select(conn, query, params))
+
+def get_top_rated_services(limit: int = 10, min_reviews: int = 1, status: Optional[str] = None) -> serialize.Rows:
+    """
+    The services with the best average rating (ties go to the one with more
+    reviews), read in order from the rating index rather than by aggregating
+    the reviews.
+    """
+    query = f'''
+        SELECT s.*, sc.name as category_name, {_SERVICE_RATINGS}
+        FROM service_ratings r
+        JOIN services s ON s.id = r.service_id
+        LEFT JOIN service_categories sc ON s.category_id = sc.id
+        WHERE r.review_count > 0 AND r.review_count >= ?
+    '''
+    params = [min_reviews]
+    if status:
+        query += ' AND s.status = ?'
+        params.append(status)
+    query += ' ORDER BY CAST(r.rating_sum AS REAL) / r.review_count DESC, r.review_count DESC LIMIT ?'
+    params.append(limit)
+    with get_db() as conn:
+        return _with_histogram(_select(conn, query, params))
 
 def get_service_by_id(service_id: int) -> Optional[dict]:
-    conn = get_db()
-    service = conn.execute('SELECT * FROM services WHERE id = ?', (service_id,)).fetchone()
-    conn.close()
+    with get_db() as conn:
+        service = conn.execute('SELECT * FROM services WHERE id = ?', (service_id,)).fetchone()
     return dict(service) if service else None
 
 def update_service_status(service_id: int, status: str) -> bool:
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE services SET status = ? WHERE id = ?', (status, service_id))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    updated = _write(lambda conn: conn.execute(
+        'UPDATE services SET status = ? WHERE id = ?', (status, service_id)).rowcount)
+    _bump('services')
+    return updated > 0
     
 # --- Booking Functions ---
-def create_booking(user_id: int, service_id: int, date: str, time: str, status: str = 'pending') -> int:
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO bookings (user_id, service_id, date, time, status) VALUES (?, ?, ?, ?, ?)',
-                   (user_id, service_id, date, time, status))
-    booking_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+def create_booking(user_id: int, service_id: int, date: str, time: str, status: str = 'pending',
+                   room_id: Optional[int] = None, staff_id: Optional[int] = None, nights: int = 1,
+                   check: Optional[Callable[[sqlite3.Connection], None]] = None) -> int:
+    """
+    Inserts a booking. `check` runs first in the same write transaction and
+    may raise to reject the booking, e.g. availability.check_conflicts.
+    """
+    def insert(conn):
+        if check:
+            check(conn)
+        return conn.execute('''
+            INSERT INTO bookings (user_id, service_id, room_id, staff_id, date, time, nights, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, service_id, room_id, staff_id, date, time, nights, status)).lastrowid
+    booking_id = _write(insert)
+    events.publish('booking_created', {
+        "id": booking_id, "user_id": user_id, "service_id": service_id, "room_id": room_id,
+        "staff_id": staff_id, "date": date, "time": time, "nights": nights, "status": status,
+    })
     return booking_id
 
-def get_bookings(user_id: Optional[int] = None) -> List[Dict[str, Any]]:
-    conn = get_db()
+def get_bookings(user_id: Optional[int] = None, status: Optional[str] = None,
+                 date_from: Optional[str] = None, date_to: Optional[str] = None,
+                 service_id: Optional[int] = None, cursor: Optional[str] = None,
+                 limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Returns one page of bookings, newest first, using keyset pagination on
+    (date, id) so that every page costs the same regardless of its position.
+    """
     query = '''
         SELECT b.*, s.name as service_name, u.full_name as user_full_name, st.full_name as staff_name
-        FROM bookings b
+        FROM bookings{archive} b
         LEFT JOIN services s ON b.service_id = s.id
         LEFT JOIN users u ON b.user_id = u.id
         LEFT JOIN staff st ON b.staff_id = st.id
     '''
-    params = ()
+    conditions, params = [], []
     if user_id:
-        query += ' WHERE b.user_id = ?'
-        params = (user_id,)
-    bookings = [dict(row) for row in conn.execute(query, params).fetchall()]
-    conn.close()
-    return bookings
+        conditions.append('b.user_id = ?')
+        params.append(user_id)
+    if status:
+        conditions.append('b.status = ?')
+        params.append(status)
+    if date_from:
+        conditions.append('b.date >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append('b.date <= ?')
+        params.append(date_to)
+    if service_id:
+        conditions.append('b.service_id = ?')
+        params.append(service_id)
+    if cursor:
+        conditions.append('(b.date, b.id) < (?, ?)')
+        params.extend(_decode_cursor(cursor))
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    with get_db() as conn:
+        conn.execute('BEGIN')
+        query, params = union_archive(query, params, archive_overlaps(conn, 'bookings', date_from))
+        rows = _select(conn, query + ' ORDER BY date DESC, id DESC LIMIT ?', params + [limit + 1])
+    return _page(rows, limit, 'date', 'id')
 
 def update_booking_status(booking_id: int, status: str) -> bool:
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE bookings SET status = ? WHERE id = ?', (status, booking_id))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
+    rows = _write(lambda conn: conn.execute('UPDATE bookings SET status = ? WHERE id = ? RETURNING user_id',
+                                            (status, booking_id)).fetchall())
+    if not rows:
+        return False
+    events.publish('booking_updated', {"id": booking_id, "user_id": rows[0][0], "status": status})
+    return True
+
+def create_bookings_bulk(bookings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Validates a batch of bookings together (one lookup for every referenced
+    service) and inserts the valid ones with a single executemany in one
+    transaction. Returns one result per input item, in order.
+    """
+    service_ids = {b["service_id"] for b in bookings}
+    results, rows = [], []
+    with get_db() as conn:
+        known = {row[0] for row in conn.execute(
+            'SELECT id FROM services WHERE id IN (SELECT value FROM json_each(?))',
+            (json.dumps(list(service_ids)),))}
+        for index, booking in enumerate(bookings):
+            status = booking.get("status", "pending")
+            if booking["service_id"] not in known:
+                results.append({"index": index, "error": "Service not found"})
+            elif status not in BOOKING_STATUSES:
+                results.append({"index": index, "error": f"Invalid status '{status}'"})
+            else:
+                results.append({"index": index})
+                rows.append((booking["user_id"], booking["service_id"], booking["date"], booking["time"], status))
+    if rows:
+        def insert(conn):
+            conn.executemany('INSERT INTO bookings (user_id, service_id, date, time, status) VALUES (?, ?, ?, ?, ?)', rows)
+            # AUTOINCREMENT ids inside a single write transaction are consecutive
+            return conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        next_id = _write(insert) - len(rows) + 1
+        for result in results:
+            if "error" not in result:
+                result["id"] = next_id
+                next_id += 1
+    for result, (user_id, service_id, booking_date, booking_time, status) in zip(
+            (r for r in results if "id" in r), rows):
+        events.publish('booking_created', {
+            "id": result["id"], "user_id": user_id, "service_id": service_id, "room_id": None,
+            "staff_id": None, "date": booking_date, "time": booking_time, "nights": 1, "status": status,
+        })
+    return results
+
+def update_booking_statuses_bulk(updates: List[Tuple[int, str]]) -> List[Dict[str, Any]]:
+    """Applies many (booking id, status) changes in one transaction and reports each outcome."""
+    def apply(conn):
+        results, rows = [], []
+        owners = {row[0]: row[1] for row in conn.execute(
+            'SELECT id, user_id FROM bookings WHERE id IN (SELECT value FROM json_each(?))',
+            (json.dumps([booking_id for booking_id, _ in updates]),))}
+        for booking_id, status in updates:
+            if booking_id not in owners:
+                results.append({"id": booking_id, "updated": False, "error": "Booking not found"})
+            elif status not in BOOKING_STATUSES:
+                results.append({"id": booking_id, "updated": False, "error": f"Invalid status '{status}'"})
+            else:
+                results.append({"id": booking_id, "updated": True})
+                rows.append((status, booking_id))
+        conn.executemany('UPDATE bookings SET status = ? WHERE id = ?', rows)
+        return results, rows, owners
+    results, rows, owners = _write(apply)
+    for status, booking_id in rows:
+        events.publish('booking_updated', {"id": booking_id, "user_id": owners[booking_id], "status": status})
+    return results
 
 # --- Staff Functions ---
 def create_staff(full_name: str, specialty: str) -> int:
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO staff (full_name, specialty) VALUES (?, ?)', (full_name, specialty))
-    staff_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return staff_id
-
-def get_staff() -> List[Dict[str, Any]]:
-    conn = get_db()
-    staff_list = [dict(row) for row in conn.execute('SELECT * FROM staff').fetchall()]
-    conn.close()
-    return staff_list
+    return _write(lambda conn: conn.execute(
+        'INSERT INTO staff (full_name, specialty) VALUES (?, ?)', (full_name, specialty)).lastrowid)
+
+def get_staff() -> serialize.Rows:
+    with get_db() as conn:
+        return _select(conn, 'SELECT * FROM staff')
 
 # --- Room Functions ---
 def create_room(room_number: str, type: str, price_per_night: float) -> int:
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO rooms (room_number, type, price_per_night) VALUES (?, ?, ?)',
-                   (room_number, type, price_per_night))
-    room_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    room_id = _write(lambda conn: conn.execute('INSERT INTO rooms (room_number, type, price_per_night) VALUES (?, ?, ?)',
+                                               (room_number, type, price_per_night)).lastrowid)
+    _bump('rooms')
     return room_id
 
-def get_rooms() -> List[Dict[str, Any]]:
-    conn = get_db()
-    rooms_list = [dict(row) for row in conn.execute('SELECT * FROM rooms').fetchall()]
-    conn.close()
-    return rooms_list
+def get_rooms() -> serialize.Rows:
+    with get_db() as conn:
+        return _select(conn, 'SELECT * FROM rooms')
 
 # --- Review Functions ---
-def create_review(booking_id: int, user_id: int, rating: int, comment: str) -> int:
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO reviews (booking_id, user_id, rating, comment) VALUES (?, ?, ?, ?)',
-                   (booking_id, user_id, rating, comment))
-    review_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+def create_review(booking_id: int, user_id: int, rating: int, comment: str) -> Optional[int]:
+    """
+    Reviews a live booking; returns None if there is no such booking. Archived
+    bookings cannot be reviewed any more (ValueError): reviews are joined to
+    the booking in the same table generation, and search covers live reviews.
+    """
+    def insert(conn):
+        if conn.execute('SELECT 1 FROM bookings WHERE id = ?', (booking_id,)).fetchone() is None:
+            if conn.execute('SELECT 1 FROM bookings_archive WHERE id = ?', (booking_id,)).fetchone():
+                raise ValueError("Archived bookings can no longer be reviewed")
+            return None
+        return conn.execute('INSERT INTO reviews (booking_id, user_id, rating, comment) VALUES (?, ?, ?, ?)',
+                            (booking_id, user_id, rating, comment)).lastrowid
+    review_id = _write(insert)
+    if review_id is not None:
+        _bump('reviews')
     return review_id
 
-def get_reviews() -> List[Dict[str, Any]]:
-    conn = get_db()
-    reviews = [dict(row) for row in conn.execute('''
+def get_reviews(user_id: Optional[int] = None, service_id: Optional[int] = None,
+                date_from: Optional[str] = None, date_to: Optional[str] = None,
+                cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """Returns one page of reviews, newest first, using keyset pagination on (created_at, id)."""
+    query = '''
         SELECT r.*, u.full_name as author_name, s.name as service_name
-        FROM reviews r
+        FROM reviews{archive} r
         JOIN users u ON r.user_id = u.id
-        JOIN bookings b ON r.booking_id = b.id
+        JOIN bookings{archive} b ON r.booking_id = b.id
         LEFT JOIN services s ON b.service_id = s.id
-        ORDER BY r.created_at DESC
-    ''').fetchall()]
-    conn.close()
-    return reviews
+    '''
+    conditions, params = [], []
+    if user_id:
+        conditions.append('r.user_id = ?')
+        params.append(user_id)
+    if service_id:
+        conditions.append('b.service_id = ?')
+        params.append(service_id)
+    if date_from:
+        conditions.append('r.created_at >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append("r.created_at < date(?, '+1 day')")
+        params.append(date_to)
+    if cursor:
+        conditions.append('(r.created_at, r.id) < (?, ?)')
+        params.extend(_decode_cursor(cursor))
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    with get_db() as conn:
+        conn.execute('BEGIN')
+        query, params = union_archive(query, params, archive_overlaps(conn, 'reviews', date_from))
+        rows = _select(conn, query + ' ORDER BY created_at DESC, id DESC LIMIT ?', params + [limit + 1])
+    return _page(rows, limit, 'created_at', 'id')
 
-# --- Analytics Functions ---
-def get_revenue_data(days: int) -> Dict[str, Any]:
-    conn = get_db()
-    date_limit = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-    rows = conn.execute('''
-        SELECT b.date, SUM(s.price) as daily_revenue FROM bookings b
-        JOIN services s ON b.service_id = s.id
-        WHERE b.status = 'completed' AND b.date >= ? GROUP BY b.date ORDER BY b.date ASC
-    ''', (date_limit,)).fetchall()
-    conn.close()
-    return {
-        "labels": [row['date'] for row in rows],
-        "datasets": [{"label": "Daily Revenue", "data": [row['daily_revenue'] for row in rows]}]
-    }
+# --- Archive Functions ---
+ARCHIVE_STATUSES = ('completed', 'cancelled')
+# Rows that follow a booking into the archive: (table, column holding the
+# booking id, column whose newest archived value is recorded as the horizon)
+_ARCHIVE_MOVES = (
+    ('reviews', 'booking_id', 'created_at'),
+    ('payments', 'booking_id', 'payment_date'),
+    ('booking_products', 'booking_id', None),
+    ('bookings', 'id', 'date'),
+)
+
+def archive_bookings_batch(cutoff: str, batch_size: int) -> Dict[str, int]:
+    """
+    Moves up to `batch_size` completed or cancelled bookings dated before
+    `cutoff`, together with their reviews, payments and products, into the
+    archive tables in one transaction. Returns the rows moved per table.
+    """
+    def move(conn):
+        ids = json.dumps([row[0] for row in conn.execute(f'''
+            SELECT id FROM bookings WHERE status IN ({','.join('?' * len(ARCHIVE_STATUSES))}) AND date < ? LIMIT ?
+        ''', (*ARCHIVE_STATUSES, cutoff, batch_size))])
+        moved = {}
+        for table, key, horizon in _ARCHIVE_MOVES:
+            columns = ', '.join(row[1] for row in conn.execute(f'PRAGMA table_info({table}_archive)'))
+            selected = f'{key} IN (SELECT value FROM json_each(?))'
+            if horizon:
+                conn.execute(f'''
+                    INSERT INTO archive_horizons (table_name, horizon)
+                    SELECT ?, newest FROM (SELECT MAX({horizon}) AS newest FROM {table} WHERE {selected})
+                    WHERE newest IS NOT NULL
+                    ON CONFLICT (table_name) DO UPDATE SET horizon = MAX(horizon, excluded.horizon)
+                ''', (table, ids))
+            conn.execute(f'INSERT INTO {table}_archive ({columns}) SELECT {columns} FROM {table} WHERE {selected}', (ids,))
+            moved[table] = conn.execute(f'DELETE FROM {table} WHERE {selected}', (ids,)).rowcount
+        return moved
+    moved = _write(move)
+    if moved['bookings']:
+        _bump('reviews')
+    return moved
+
+# --- Search Functions ---
+SEARCH_TYPES = ('services', 'reviews')
+# bm25 costs time per matching row, so a review search ranks only its newest
+# SEARCH_RANK_LIMIT matches; a very common word would otherwise rank them all.
+SEARCH_RANK_LIMIT = int(os.environ.get('HOTEL_SEARCH_RANK_LIMIT', '5000'))
+_SEARCH_TERM = re.compile(r'\w+', re.UNICODE)
+# snippet() marks matches with control characters, which html.escape leaves
+# alone, so the user's text can be escaped before the <mark> tags go in.
+_MATCH_START, _MATCH_END = '\x02', '\x03'
+
+def _highlight(rows: serialize.Rows) -> serialize.Rows:
+    """HTML-escapes the snippet column and turns the match markers into <mark> tags."""
+    index = rows.columns.index('snippet')
+    def render(snippet):
+        if snippet is None:
+            return None
+        return html.escape(snippet).replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>')
+    return serialize.Rows(rows.columns, [row[:index] + (render(row[index]),) + row[index + 1:] for row in rows.rows])
 
+def _match_query(text: str) -> str:
+    """
+    Turns free text into an FTS5 query that cannot be a syntax error: every
+    word must match, and the last one also matches as a prefix so results
+    follow the user as they type.
+    """
+    terms = _SEARCH_TERM.findall(text)
+    if not terms:
+        raise ValueError("Search text must contain at least one word")
+    return ' '.join(f'"{term}"' for term in terms[:-1]) + (' ' if len(terms) > 1 else '') + f'"{terms[-1]}"*'
+
+def search(text: str, type: str = 'reviews', cursor: Optional[str] = None,
+           limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Ranks services or reviews against the search text by bm25, best first,
+    with an HTML-escaped, highlighted snippet per result. Pages are keyed on (rank, id).
+    Reviews beyond the newest SEARCH_RANK_LIMIT matches are left out, and so
+    are archived reviews: the full-text index covers live reviews only.
+    """
+    if type not in SEARCH_TYPES:
+        raise ValueError(f"type must be one of {', '.join(SEARCH_TYPES)}")
+    match = _match_query(text)
+    params: List[Any] = [match]
+    keyset = ''
+    if type == 'reviews':
+        with get_db() as conn:
+            floor = conn.execute('SELECT rowid FROM reviews_fts WHERE reviews_fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?',
+                                 (match, SEARCH_RANK_LIMIT - 1)).fetchone()
+        if floor:
+            keyset = 'AND f.rowid >= ? '
+            params.append(floor[0])
+    if cursor:
+        rank, last_id = _decode_cursor(cursor)
+        keyset += 'AND (f.rank > ? OR (f.rank = ? AND f.rowid > ?))'
+        params.extend((rank, rank, last_id))
+    params.append(limit + 1)
+    if type == 'services':
+        query = f'''
+            SELECT s.id, s.name, s.description, s.price, s.status, sc.name as category_name,
+                   snippet(services_fts, -1, char(2), char(3), '…', 16) as snippet, f.rank
+            FROM services_fts f
+            JOIN services s ON s.id = f.rowid
+            LEFT JOIN service_categories sc ON s.category_id = sc.id
+            WHERE services_fts MATCH ? {keyset}
+            ORDER BY f.rank, f.rowid LIMIT ?
+        '''
+    else:
+        query = f'''
+            SELECT r.id, r.booking_id, r.user_id, r.rating, r.comment, r.created_at,
+                   u.full_name as author_name, s.name as service_name,
+                   snippet(reviews_fts, 0, char(2), char(3), '…', 16) as snippet, f.rank
+            FROM reviews_fts f
+            JOIN reviews r ON r.id = f.rowid
+            JOIN users u ON r.user_id = u.id
+            JOIN bookings b ON r.booking_id = b.id
+            LEFT JOIN services s ON b.service_id = s.id
+            WHERE reviews_fts MATCH ? {keyset}
+            ORDER BY f.rank, f.rowid LIMIT ?
+        '''
+    with get_db() as conn:
+        rows = _select(conn, query, params)
+    return _page(_highlight(rows), limit, 'rank', 'id')
+
+# --- Analytics Functions ---
+# Revenue and service usage are served from the daily_service_stats rollups,
+# so their cost depends on the window size rather than the booking history.
 def get_revenue_data(days: int) -> Dict[str, Any]:
-    conn = get_db()
     date_limit = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-    rows = conn.execute('''
-        SELECT b.date, SUM(s.price) as daily_revenue FROM bookings b
-        JOIN services s ON b.service_id = s.id
-        WHERE b.status = 'completed' AND b.date >= ? GROUP BY b.date ORDER BY b.date ASC
-    ''', (date_limit,)).fetchall()
-    conn.close()
+    with get_db() as conn:
+        rows = conn.execute('''
+            SELECT r.date, SUM(r.completed_count * s.price) as daily_revenue FROM daily_service_stats r
+            JOIN services s ON r.service_id = s.id
+            WHERE r.date >= ? AND r.completed_count > 0 GROUP BY r.date ORDER BY r.date ASC
+        ''', (date_limit,)).fetchall()
     
     labels = [row['date'] for row in rows]
     data = [row['daily_revenue'] for row in rows]
@@ -365,15 +877,14 @@ def get_revenue_data(days: int) -> Dict[str, Any]:
     }
 
 def get_service_usage_data(days: int) -> Dict[str, Any]:
-    conn = get_db()
     date_limit = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-    rows = conn.execute('''
-        SELECT s.name as service_name, COUNT(b.id) as booking_count
-        FROM bookings b JOIN services s ON b.service_id = s.id
-        WHERE b.date >= ? AND b.service_id IS NOT NULL
-        GROUP BY s.name ORDER BY booking_count DESC
-    ''', (date_limit,)).fetchall()
-    conn.close()
+    with get_db() as conn:
+        rows = conn.execute('''
+            SELECT s.name as service_name, SUM(r.booking_count) as booking_count
+            FROM daily_service_stats r JOIN services s ON r.service_id = s.id
+            WHERE r.date >= ?
+            GROUP BY s.name HAVING SUM(r.booking_count) > 0 ORDER BY booking_count DESC
+        ''', (date_limit,)).fetchall()
 
     labels = [row['service_name'] for row in rows]
     data = [row['booking_count'] for row in rows]
@@ -393,13 +904,12 @@ def get_occupancy_data() -> Dict[str, Any]:
     """
     Calculates room occupancy rates.
     """
-    conn = get_db()
-    rows = conn.execute('''
-        SELECT status, COUNT(id) as count
-        FROM rooms
-        GROUP BY status
-    ''').fetchall()
-    conn.close()
+    with get_db() as conn:
+        rows = conn.execute('''
+            SELECT status, COUNT(id) as count
+            FROM rooms
+            GROUP BY status
+        ''').fetchall()
 
     labels = [row['status'].capitalize() for row in rows]
     data = [row['count'] for row in rows]
@@ -428,10 +938,9 @@ def update_room_status(room_id: int, status: str) -> bool:
     """
     Updates the status of a specific room in the database.
     """
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE rooms SET status = ? WHERE id = ?', (status, room_id))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
-    return success
\ No newline at end of file
+    updated = _write(lambda conn: conn.execute(
+        'UPDATE rooms SET status = ? WHERE id = ?', (status, room_id)).rowcount)
+    _bump('rooms')
+    if updated > 0:
+        events.publish('room_status', {"id": room_id, "status": status})
+    return updated > 0
@@ -0,0 +1,97 @@
+import asyncio
+import itertools
+import os
+import threading
+from typing import Any, Callable, Dict, List, Set
+import metrics
+
+# Per-subscriber buffer. A subscriber that falls this far behind is sent a
+# single "resync" event instead, telling it to refetch the full state.
+SUBSCRIBER_QUEUE_SIZE = int(os.environ.get('HOTEL_EVENT_QUEUE_SIZE', '256'))
+
+EVENTS_PUBLISHED = metrics.Counter(
+    'hotel_events_published_total', 'Change events published to the in-process event bus.', ('topic',))
+SUBSCRIBERS_LAGGED = metrics.Counter(
+    'hotel_event_subscribers_lagged_total', 'Times a subscriber fell behind and was told to resync.')
+
+class Event:
+    __slots__ = ('id', 'topic', 'data')
+
+    def __init__(self, event_id: int, topic: str, data: Dict[str, Any]):
+        self.id = event_id
+        self.topic = topic
+        self.data = data
+
+class Subscription:
+    """One subscriber's bounded queue, owned by the event loop it was created on."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def _put(self, event: Event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            SUBSCRIBERS_LAGGED.inc()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(Event(event.id, 'resync', {}))
+
+    async def get(self) -> Event:
+        return await self.queue.get()
+
+class EventBus:
+    """
+    In-process pub/sub for change events. publish() may be called from any
+    thread (the data layer runs on executor threads); delivery is handed to
+    each subscriber's event loop, so idle subscribers cost nothing.
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscription] = set()
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def listen(self, callback: Callable[[str, Dict[str, Any]], None]):
+        """Registers a callback run synchronously on the publishing thread; it must be cheap."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def publish(self, topic: str, data: Dict[str, Any]):
+        EVENTS_PUBLISHED.inc(topic=topic)
+        for callback in self._listeners:
+            callback(topic, data)
+        if not self._subscribers:
+            return
+        event = Event(next(self._ids), topic, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, event)
+            except RuntimeError:
+                # the subscriber's loop has closed
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+bus = EventBus()
+
+metrics.Gauge('hotel_event_subscribers', 'Connected event stream subscribers.', lambda: bus.subscriber_count())
+
+def publish(topic: str, data: Dict[str, Any]):
+    bus.publish(topic, data)
@@ -0,0 +1,115 @@
+import csv
+import io
+import os
+import sqlite3
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import quote
+import db
+import metrics
+import serialize
+
+# Exports read through their own read-only connection, CHUNK_ROWS rows at a
+# time, so memory stays flat however large the table is. The read runs in a
+# WAL snapshot: it sees a consistent table and never blocks writers.
+CHUNK_ROWS = int(os.environ.get('HOTEL_EXPORT_CHUNK_ROWS', '1000'))
+
+FORMATS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+EXPORT_ROWS = metrics.Counter('hotel_export_rows_total', 'Rows streamed by the export endpoints.', ('table',))
+
+class ExportSpec:
+    def __init__(self, query: str, key_column: str, date_column: str, status_column: Optional[str]):
+        self.query = query
+        self.key_column = key_column
+        self.date_column = date_column
+        self.status_column = status_column
+
+EXPORTS = {
+    'bookings': ExportSpec('''
+        SELECT b.id, b.user_id, u.email as user_email, b.service_id, s.name as service_name,
+               b.room_id, b.staff_id, b.date, b.time, b.nights, b.status
+        FROM bookings{archive} b
+        LEFT JOIN users u ON b.user_id = u.id
+        LEFT JOIN services s ON b.service_id = s.id
+    ''', 'b.id', 'b.date', 'b.status'),
+    'payments': ExportSpec('''
+        SELECT p.id, p.booking_id, b.user_id, b.service_id, p.amount, p.payment_date, p.status
+        FROM payments{archive} p
+        LEFT JOIN bookings{archive} b ON p.booking_id = b.id
+    ''', 'p.id', 'p.payment_date', 'p.status'),
+    'reviews': ExportSpec('''
+        SELECT r.id, r.booking_id, r.user_id, b.service_id, r.rating, r.comment, r.created_at
+        FROM reviews{archive} r
+        LEFT JOIN bookings{archive} b ON r.booking_id = b.id
+    ''', 'r.id', 'r.created_at', None),
+}
+
+def build_query(table: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                status: Optional[str] = None, archived: bool = False) -> Tuple[str, List[str]]:
+    """
+    The export query for a table and its filters, in primary key order;
+    `archived` adds the rows moved to the table's archive.
+    """
+    spec = EXPORTS.get(table)
+    if spec is None:
+        raise ValueError(f"Unknown export '{table}'")
+    conditions, params = [], []
+    if date_from:
+        conditions.append(f'{spec.date_column} >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append(f"{spec.date_column} < date(?, '+1 day')")
+        params.append(date_to)
+    if status:
+        if spec.status_column is None:
+            raise ValueError(f"The {table} export has no status filter")
+        conditions.append(f'{spec.status_column} = ?')
+        params.append(status)
+    query = spec.query
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query, params = db.union_archive(query, params, archived)
+    # A compound SELECT is ordered by result column; every export starts with its key
+    return query + (' ORDER BY 1' if archived else f' ORDER BY {spec.key_column}'), params
+
+def _connect_readonly() -> sqlite3.Connection:
+    # Consumed from Starlette's threadpool, one chunk per call, never concurrently
+    conn = sqlite3.connect(f'file:{quote(os.path.abspath(db.DB_PATH))}?mode=ro', uri=True,
+                           check_same_thread=False, isolation_level=None)
+    conn.execute('PRAGMA query_only = ON')
+    return conn
+
+def _csv_chunk(rows: List[tuple], header: Optional[Tuple[str, ...]] = None) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+def _ndjson_chunk(columns: Tuple[str, ...], rows: List[tuple]) -> bytes:
+    return b''.join(serialize.dumps(dict(zip(columns, row))) + b'\n' for row in rows)
+
+def stream(table: str, format: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+           status: Optional[str] = None) -> Iterator[bytes]:
+    """Yields the export in encoded chunks from a snapshot read transaction."""
+    conn = _connect_readonly()
+    try:
+        conn.execute('BEGIN')
+        archived = db.archive_overlaps(conn, table, date_from)
+        cursor = conn.execute(*build_query(table, date_from, date_to, status, archived))
+        columns = tuple(column[0] for column in cursor.description)
+        first = True
+        while True:
+            rows = cursor.fetchmany(CHUNK_ROWS)
+            if format == 'csv':
+                if rows or first:
+                    yield _csv_chunk(rows, columns if first else None)
+            elif rows:
+                yield _ndjson_chunk(columns, rows)
+            if not rows:
+                break
+            first = False
+            EXPORT_ROWS.inc(len(rows), table=table)
+    finally:
+        conn.close()
@@ -1,39 +1,173 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query, APIRouter
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi import FastAPI, Depends, HTTPException, status, Query, APIRouter, Request, Response
+from fastapi.security import HTTPBasic, HTTPBasicCredentials, HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from passlib.context import CryptContext
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, EmailStr, Field
-from typing import List, Optional
+from contextlib import asynccontextmanager, suppress
+from typing import Dict, List, Optional
+import asyncio
+import json
+import time
 import db
-import uvicorn
-
-# The FastAPI instance is created here and named 'app'.
-# The error occurs if you try to run uvicorn telling it to look for 'fast'.
-# Correct command: uvicorn fast:app --reload
-app = FastAPI()
-
-# --- CORS Middleware ---
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+import adb
+import archive
+import assignment
+import availability
+import billing
+import cache
+import events
+import exports
+import hashing
+import metrics
+import ratelimit
+import serialize
+import tokens
+from settings import Settings
+
+# The app is built by create_app(settings). Run it with
+#   uvicorn fast:app --reload                (settings from HOTEL_* variables)
+#   uvicorn --factory fast:create_app
+# Heavy modules (numpy for analytics, passlib for bcrypt) are imported on
+# first use, and the database is migrated once in the startup hook, so
+# importing this module touches neither the disk nor the database.
+# --- Metrics ---
+REQUEST_SECONDS = metrics.Histogram(
+    'hotel_http_request_seconds', 'HTTP request latency by route.', ('method', 'route', 'status'))
+AUTH_SECONDS = metrics.Histogram(
+    'hotel_auth_seconds', 'Time spent authenticating a request.', ('scheme',))
+SERIALIZATION_SECONDS = metrics.Histogram(
+    'hotel_serialization_seconds', 'Time spent encoding JSON response bodies.')
+
+class TimedJSONResponse(JSONResponse):
+    """
+    The default JSON response: encodes with orjson when available, recording
+    how long encoding the body takes. List routes return it directly with
+    serialize.Rows content, which skips FastAPI's jsonable_encoder pass.
+    """
 
-# --- Security & Auth ---
-security = HTTPBasic()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        body = serialize.dumps(content)
+        SERIALIZATION_SECONDS.observe(time.perf_counter() - started)
+        return body
+
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                            route=route.path if route else "unmatched", status=str(response.status_code))
+    return response
+
+# --- Rate Limiting ---
+class RateLimitMiddleware:
+    """
+    Applies the app's rate policies before routing: per-client token buckets
+    (the user id for a valid bearer token, otherwise the client IP) and
+    in-flight limits, answering 429 with Retry-After when either is exceeded.
+    A plain ASGI middleware, so an in-flight slot is held until a streamed
+    response has been fully sent or the client has gone away.
+    """
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    def __init__(self, app, limiter: ratelimit.Limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        policy = self.limiter.match(scope["method"], scope["path"])
+        if policy is None:
+            return await self.app(scope, receive, send)
+        retry_after = self.limiter.acquire(policy, _client_key(scope))
+        if retry_after is not None:
+            response = JSONResponse(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                    content={"detail": "Too many requests, please retry later"},
+                                    headers={"Retry-After": str(retry_after)})
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release(policy)
+
+_limiter: Optional[ratelimit.Limiter] = None
+
+metrics.Gauge('hotel_rate_limit_in_flight', 'Requests in flight under a concurrency-limited policy.',
+              lambda: _limiter.stats() if _limiter is not None else {}, ('policy',))
+
+def _client_key(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"authorization" and value[:7].lower() == b"bearer ":
+            try:
+                return f"user:{tokens.verify_token(value[7:].decode('latin-1'))['sub']}"
+            except tokens.InvalidToken:
+                break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# --- Security & Auth ---
+# Bearer tokens from POST /token are checked without bcrypt; the database is
+# read only for the user's revocation time, which each worker caches
+# briefly (see tokens.py). HTTP Basic is still accepted as a fallback.
+security = HTTPBasic(auto_error=False)
+bearer_security = HTTPBearer(auto_error=False)
+
+async def hash_queue_full_handler(request: Request, exc: hashing.HashQueueFull):
+    """Sheds password work fast instead of letting latency build up behind a full hash queue."""
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+async def get_current_user(
+    request: Request,
+    bearer: Optional[HTTPAuthorizationCredentials] = Depends(bearer_security),
+    credentials: Optional[HTTPBasicCredentials] = Depends(security),
+):
+    started = time.perf_counter()
+    try:
+        if bearer:
+            return await _user_from_token(bearer.credentials)
+        if request.app.state.settings.auth_mode == "token":
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="A bearer token from POST /token is required",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return await _user_from_basic(credentials)
+    finally:
+        AUTH_SECONDS.observe(time.perf_counter() - started, scheme="bearer" if bearer else "basic")
+
+async def get_login_user(credentials: Optional[HTTPBasicCredentials] = Depends(security)):
+    """HTTP Basic only; the one place passwords are checked whatever the auth mode."""
+    started = time.perf_counter()
+    try:
+        return await _user_from_basic(credentials)
+    finally:
+        AUTH_SECONDS.observe(time.perf_counter() - started, scheme="basic")
 
-def get_current_user(credentials: HTTPBasicCredentials = Depends(security)):
-    user = db.get_user_by_email(credentials.username)
-    if not user or not verify_password(credentials.password, user.get("password", "")):
+async def _user_from_token(token: str) -> dict:
+    try:
+        claims = tokens.verify_token(token)
+        revoked_before = tokens.cached_revoked_before(claims["sub"])
+        if revoked_before is None:
+            revoked_before = await adb.run(tokens.load_revoked_before, claims["sub"])
+        tokens.check_revoked(claims, revoked_before)
+    except tokens.InvalidToken as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {
+        "id": claims["sub"],
+        "email": claims["email"],
+        "full_name": claims["name"],
+        "is_admin": int(claims["adm"]),
+        "isAdmin": claims["adm"],
+    }
+
+async def _user_from_basic(credentials: Optional[HTTPBasicCredentials]) -> dict:
+    user = await adb.get_user_by_email(credentials.username) if credentials else None
+    if not user or not await hashing.verify_password(credentials.password, user.get("password", "")):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password",
@@ -48,20 +182,91 @@ def get_current_admin_user(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Requires admin privileges")
     return current_user
 
+# --- Response Cache ---
+response_cache = cache.ResponseCache()
+
+metrics.Gauge('hotel_response_cache_entries', 'Responses held in the response cache.',
+              lambda: response_cache.stats()["entries"])
+metrics.Gauge('hotel_response_cache_hits_total', 'Response cache hits.',
+              lambda: response_cache.stats()["hits"], kind='counter')
+metrics.Gauge('hotel_response_cache_misses_total', 'Response cache misses.',
+              lambda: response_cache.stats()["misses"], kind='counter')
+
+dashboard_cache = cache.ResponseCache(max_entries=64, ttl=cache.DASHBOARD_CACHE_TTL)
+
+# Concurrent misses on the same key wait for one build instead of each running it
+_builds: Dict[tuple, asyncio.Task] = {}
+
+async def _build_entry(store: cache.ResponseCache, key: tuple, build) -> cache.CachedResponse:
+    payload, headers = await build()
+    started = time.perf_counter()
+    body = serialize.dumps(payload)
+    SERIALIZATION_SECONDS.observe(time.perf_counter() - started)
+    return store.put(key, body, headers)
+
+async def cached_response(request: Request, tables: tuple, build,
+                          store: cache.ResponseCache = response_cache) -> Response:
+    """
+    Serves a GET from a response cache (`store`). Entries are keyed on the
+    route, its query parameters and the versions of the tables it reads, and
+    a matching If-None-Match gets a 304 without rebuilding the body.
+    `build` returns the payload and any extra response headers.
+    """
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())), db.table_versions(*tables))
+    entry = store.get(key)
+    if entry is None:
+        task = _builds.get(key)
+        if task is None:
+            task = asyncio.ensure_future(_build_entry(store, key, build))
+            _builds[key] = task
+            task.add_done_callback(lambda _: _builds.pop(key, None))
+        # A waiter that disconnects does not cancel the build for the others
+        entry = await asyncio.shield(task)
+    headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "no-cache"}
+    if entry.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
 # --- Pydantic Models ---
 class UserCreate(BaseModel):
     email: EmailStr
     password: str
     full_name: str
 
+class PasswordUpdate(BaseModel):
+    current_password: str
+    password: str
+
+class RoleUpdate(BaseModel):
+    is_admin: bool
+
 class BookingCreate(BaseModel):
     service_id: int
     date: str
     time: str
+    room_id: Optional[int] = None
+    staff_id: Optional[int] = None
+    nights: int = Field(1, ge=1)
 
 class BookingUpdate(BaseModel):
     status: str
 
+class BulkBookingItem(BaseModel):
+    service_id: int
+    date: str
+    time: str
+    user_id: Optional[int] = None
+    status: str = "pending"
+
+class BulkStatusItem(BaseModel):
+    id: int
+    status: str
+
+class StaffAssignmentRun(BaseModel):
+    date_from: str
+    date_to: str
+    dry_run: bool = False
+
 class ServiceUpdate(BaseModel):
     status: str
 
@@ -80,26 +285,56 @@ class ReviewCreate(BaseModel):
     comment: Optional[str] = None
 
 # --- Main API Endpoints ---
-@app.post("/token")
-def get_token(user: dict = Depends(get_current_user)):
-    """Provides a token-like object confirming user authentication."""
+api_router = APIRouter()
+
+@api_router.post("/token")
+async def get_token(user: dict = Depends(get_login_user)):
+    """Issues a signed bearer token along with the authenticated user's data."""
     user_data = user.copy()
-    if "password" in user_data:
-        del user_data["password"]
-    return user_data
+    user_data.pop("password", None)
+    user_data.pop("tokens_revoked_before", None)
+    return {**user_data, **tokens.issue_token(user_data)}
+
+@api_router.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT)
+def revoke_tokens(user: dict = Depends(get_current_user)):
+    """Logs the user out everywhere by revoking every token issued to them."""
+    tokens.revoke_user_tokens(user["id"])
+
+@api_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics():
+    """Exposes request, auth, serialization, database and cache metrics in the Prometheus text format."""
+    return metrics.render()
 
-@app.post("/users/", status_code=status.HTTP_201_CREATED)
+@api_router.post("/users/", status_code=status.HTTP_201_CREATED)
 async def create_user_endpoint(user: UserCreate):
     """Handles new user registration."""
-    if db.get_user_by_email(user.email):
+    if await adb.get_user_by_email(user.email):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hashing.hash_password(user.password)
     try:
-        db.create_user(user.email, hashed_password, user.full_name)
+        await adb.create_user(user.email, hashed_password, user.full_name)
         return {"message": "User created successfully"}
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
+@api_router.put("/users/me/password")
+async def update_own_password(update: PasswordUpdate, current_user: dict = Depends(get_current_user)):
+    """Changes the caller's password; the current one is required, so a stolen token is not enough."""
+    user = await adb.get_user_by_email(current_user["email"])
+    if not user or not await hashing.verify_password(update.current_password, user.get("password", "")):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Current password is incorrect")
+    hashed_password = await hashing.hash_password(update.password)
+    await adb.update_user_password(current_user["id"], hashed_password)
+    await adb.run(tokens.revoke_user_tokens, current_user["id"])
+    return {"message": "Password updated, please log in again"}
+
+@api_router.put("/users/{user_id}/role", dependencies=[Depends(get_current_admin_user)])
+async def update_user_role(user_id: int, update: RoleUpdate):
+    if not await adb.set_user_admin(user_id, update.is_admin):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    await adb.run(tokens.revoke_user_tokens, user_id)
+    return {"message": f"User {user_id} role updated"}
+
 # --- Routers for Organization ---
 services_router = APIRouter(prefix="/services", tags=["services"])
 bookings_router = APIRouter(prefix="/bookings", tags=["bookings"])
@@ -109,86 +344,309 @@ reviews_router = APIRouter(prefix="/reviews", tags=["reviews"])
 
 # --- Services Routes ---
 @services_router.get("/")
-async def get_services(status: Optional[str] = Query(None)):
-    return db.get_services(status=status)
+async def get_services(request: Request, status: Optional[str] = Query(None)):
+    """Lists services with their review count, average rating and rating histogram."""
+    async def build():
+        return await adb.get_services(status=status), {}
+    return await cached_response(request, ("services", "reviews"), build)
+
+@services_router.get("/top-rated")
+async def get_top_rated_services(
+    request: Request,
+    status: Optional[str] = Query(None),
+    min_reviews: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """The best-rated services, from the per-service rating aggregates."""
+    async def build():
+        return await adb.get_top_rated_services(limit=limit, min_reviews=min_reviews, status=status), {}
+    return await cached_response(request, ("services", "reviews"), build)
 
 @services_router.put("/{service_id}")
 async def update_service_status(service_id: int, service_update: ServiceUpdate, admin: dict = Depends(get_current_admin_user)):
-    if not db.update_service_status(service_id, service_update.status):
+    if not await adb.update_service_status(service_id, service_update.status):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Service not found")
     return {"message": f"Service {service_id} status updated to {service_update.status}"}
 
 # --- Bookings Routes ---
 @bookings_router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_booking(booking: BookingCreate, current_user: dict = Depends(get_current_user)):
-    if not db.get_service_by_id(booking.service_id):
+    if not await adb.get_service_by_id(booking.service_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Service not found")
-    booking_id = db.create_booking(current_user["id"], booking.service_id, booking.date, booking.time)
+    hold = None
+    if booking.room_id or booking.staff_id:
+        try:
+            hold = await adb.run(availability.engine.reserve, booking.room_id, booking.staff_id,
+                                 booking.service_id, booking.date, booking.time, booking.nights)
+        except availability.BookingConflict as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date or time")
+    def check(conn):
+        # Authoritative: sees bookings made by every worker, not just this one
+        availability.check_conflicts(conn, booking.room_id, booking.staff_id, booking.service_id,
+                                     booking.date, booking.time, booking.nights)
+    try:
+        booking_id = await adb.create_booking(current_user["id"], booking.service_id, booking.date, booking.time,
+                                              room_id=booking.room_id, staff_id=booking.staff_id,
+                                              nights=booking.nights, check=check if hold else None)
+    except availability.BookingConflict as e:
+        availability.engine.release(hold)
+        # Booked by another worker; index it so the pre-check catches it next time
+        await adb.run(availability.engine.refresh_bookings, [e.booking_id])
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except Exception:
+        if hold:
+            availability.engine.release(hold)
+        raise
+    if hold:
+        availability.engine.confirm(hold, booking_id)
     return {"id": booking_id, **booking.dict()}
 
 @bookings_router.get("/")
-async def get_bookings(current_user: dict = Depends(get_current_user)):
-    if current_user["isAdmin"]:
-        return db.get_bookings()
-    else:
-        return db.get_bookings(user_id=current_user["id"])
+async def get_bookings(
+    booking_status: Optional[str] = Query(None, alias="status"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    service_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(db.DEFAULT_PAGE_SIZE, ge=1, le=db.MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user),
+):
+    """Returns a page of bookings; the cursor for the next page is sent in X-Next-Cursor."""
+    if not current_user["isAdmin"]:
+        user_id = current_user["id"]
+    try:
+        page = await adb.get_bookings(user_id=user_id, status=booking_status, date_from=date_from,
+                                      date_to=date_to, service_id=service_id, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    headers = {"X-Next-Cursor": page["next_cursor"]} if page["next_cursor"] else None
+    return TimedJSONResponse(page["items"], headers=headers)
+
+# Bulk routes are declared before /{booking_id} so their paths are not captured by it.
+@bookings_router.post("/bulk")
+async def create_bookings_bulk(bookings: List[BulkBookingItem], admin: dict = Depends(get_current_admin_user)):
+    """Creates many bookings in one transaction; items without a user_id are booked for the caller."""
+    if len(bookings) > db.MAX_BULK_ITEMS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {db.MAX_BULK_ITEMS} bookings per request")
+    items = [{**booking.dict(), "user_id": booking.user_id or admin["id"]} for booking in bookings]
+    return await adb.create_bookings_bulk(items)
+
+@bookings_router.put("/bulk")
+async def update_bookings_bulk(updates: List[BulkStatusItem], admin: dict = Depends(get_current_admin_user)):
+    """Applies many booking status changes in one transaction."""
+    if len(updates) > db.MAX_BULK_ITEMS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {db.MAX_BULK_ITEMS} updates per request")
+    results = await adb.update_booking_statuses_bulk([(update.id, update.status) for update in updates])
+    await adb.run(availability.engine.refresh_bookings, [r["id"] for r in results if r["updated"]])
+    return results
+
+@bookings_router.post("/assign-staff")
+async def assign_staff(params: StaffAssignmentRun, admin: dict = Depends(get_current_admin_user)):
+    """
+    Assigns qualified, free staff to every pending booking in the date range,
+    balancing booked time, in one transaction; `dry_run` only reports the plan.
+    """
+    try:
+        return await adb.run(assignment.assign, params.date_from, params.date_to, params.dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 @bookings_router.put("/{booking_id}")
 async def update_booking(booking_id: int, booking_update: BookingUpdate, admin: dict = Depends(get_current_admin_user)):
-    if not db.update_booking_status(booking_id, booking_update.status):
+    if not await adb.update_booking_status(booking_id, booking_update.status):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
+    await adb.run(availability.engine.refresh_bookings, [booking_id])
     return {"message": "Booking updated successfully"}
 
 # --- Staff Routes (Admin Only) ---
 @staff_router.post("/", status_code=status.HTTP_201_CREATED, dependencies=[Depends(get_current_admin_user)])
 async def create_staff(staff: StaffCreate):
-    staff_id = db.create_staff(staff.full_name, staff.specialty)
+    staff_id = await adb.create_staff(staff.full_name, staff.specialty)
     return {"id": staff_id, **staff.dict()}
 
 @staff_router.get("/", dependencies=[Depends(get_current_admin_user)])
 async def get_staff():
-    return db.get_staff()
+    return TimedJSONResponse(await adb.get_staff())
 
 # --- Rooms Routes (Admin Only) ---
 @rooms_router.post("/", status_code=status.HTTP_201_CREATED, dependencies=[Depends(get_current_admin_user)])
 async def create_room(room: RoomCreate):
-    room_id = db.create_room(room.room_number, room.type, room.price_per_night)
+    room_id = await adb.create_room(room.room_number, room.type, room.price_per_night)
     return {"id": room_id, **room.dict()}
 
 @rooms_router.get("/", dependencies=[Depends(get_current_admin_user)])
 async def get_rooms():
-    return db.get_rooms()
+    return TimedJSONResponse(await adb.get_rooms())
 
 # --- Reviews Routes ---
 @reviews_router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_review(review: ReviewCreate, current_user: dict = Depends(get_current_user)):
-    review_id = db.create_review(review.booking_id, current_user["id"], review.rating, review.comment)
+    try:
+        review_id = await adb.create_review(review.booking_id, current_user["id"], review.rating, review.comment)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if review_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
     return {"id": review_id, **review.dict()}
 
 @reviews_router.get("/")
-async def get_reviews():
-    return db.get_reviews()
+async def get_reviews(
+    request: Request,
+    service_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(db.DEFAULT_PAGE_SIZE, ge=1, le=db.MAX_PAGE_SIZE),
+):
+    """Returns a page of reviews; the cursor for the next page is sent in X-Next-Cursor."""
+    async def build():
+        try:
+            page = await adb.get_reviews(user_id=user_id, service_id=service_id, date_from=date_from,
+                                         date_to=date_to, cursor=cursor, limit=limit)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        headers = {"X-Next-Cursor": page["next_cursor"]} if page["next_cursor"] else {}
+        return page["items"], headers
+    return await cached_response(request, ("reviews",), build)
+
+# --- Search Routes ---
+@api_router.get("/search", tags=["search"])
+async def search(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    type: str = Query("reviews", description="services or reviews"),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=db.MAX_PAGE_SIZE),
+):
+    """
+    Full-text search over review comments or service names, descriptions and
+    categories, best match first. Each result carries a snippet with the
+    matching words wrapped in <mark>; the next page's cursor is in X-Next-Cursor.
+    """
+    async def build():
+        try:
+            page = await adb.search(q, type=type, cursor=cursor, limit=limit)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        headers = {"X-Next-Cursor": page["next_cursor"]} if page["next_cursor"] else {}
+        return page["items"], headers
+    return await cached_response(request, ("services",) if type == "services" else ("reviews", "services"), build)
+
+availability_router = APIRouter(prefix="/availability", tags=["availability"],
+                                dependencies=[Depends(get_current_user)])
+
+# --- Availability Routes ---
+@availability_router.get("/rooms")
+async def get_free_rooms(
+    check_in: str,
+    nights: int = Query(1, ge=1),
+    type: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+):
+    """Rooms with no active booking overlapping the requested nights."""
+    try:
+        return await adb.run(availability.engine.free_rooms, check_in, nights, type, min_price, max_price)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid check_in date")
+
+@availability_router.get("/staff")
+async def get_free_staff(service_id: int, date: str, time: Optional[str] = None):
+    """Staff qualified for the service who are free for its slot on the given date and time."""
+    try:
+        free_ids = await adb.run(availability.engine.free_staff, service_id, date, time)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date or time")
+    staff = await adb.get_staff()
+    free_ids = set(free_ids)
+    return [member for member in staff if member["id"] in free_ids]
 
 analytics_router = APIRouter(prefix="/analytics", tags=["analytics"])
 
+class AnalyticsQuery:
+    """
+    Optional time-series parameters shared by the analytics charts. When none
+    are given the routes keep serving their original daily rollup payloads.
+    """
+
+    def __init__(
+        self,
+        granularity: Optional[str] = Query(None, description="day, week or month"),
+        group_by: Optional[str] = Query(None, description="service or category"),
+        rolling: int = Query(0, ge=0, description="moving average window, in buckets"),
+        percentiles: Optional[str] = Query(None, description="comma-separated, e.g. 50,90,99"),
+        deltas: bool = Query(False, description="add period-over-period change datasets"),
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+    ):
+        self.granularity = granularity
+        self.group_by = group_by
+        self.rolling = rolling
+        self.percentiles = percentiles
+        self.deltas = deltas
+        self.date_from = date_from
+        self.date_to = date_to
+
+    def requested(self) -> bool:
+        return any((self.granularity, self.group_by, self.rolling, self.percentiles, self.deltas,
+                    self.date_from, self.date_to))
+
+    async def series(self, metric: str, days: int, group_by: Optional[str] = None):
+        import analytics
+        try:
+            percentiles = [float(p) for p in self.percentiles.split(',') if p.strip()] if self.percentiles else []
+            date_from, date_to = analytics.window(days, self.date_from, self.date_to)
+            return await adb.run(analytics.engine.series, metric, date_from, date_to,
+                                 self.granularity or 'day', self.group_by or group_by,
+                                 self.rolling, percentiles, self.deltas)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 # --- Analytics Routes (Admin Only) ---
 @analytics_router.get("/revenue", dependencies=[Depends(get_current_admin_user)])
-async def get_revenue(days: int = 30):
-    return db.get_revenue_data(days)
+async def get_revenue(days: int = 30, query: AnalyticsQuery = Depends()):
+    if query.requested():
+        return await query.series('revenue', days)
+    return await adb.get_revenue_data(days)
 
 @analytics_router.get("/services", dependencies=[Depends(get_current_admin_user)])
-async def get_service_usage(days: int = 30):
+async def get_service_usage(days: int = 30, query: AnalyticsQuery = Depends()):
     """
     NEW ENDPOINT: Provides data on how many times each service was booked.
+    With time-series parameters, bookings per bucket for each service (or category).
     """
-    return db.get_service_usage_data(days)
+    if query.requested():
+        return await query.series('bookings', days, group_by='service')
+    return await adb.get_service_usage_data(days)
 
 @analytics_router.get("/occupancy", dependencies=[Depends(get_current_admin_user)])
 async def get_occupancy():
     """
     NEW ENDPOINT: Provides data on current room occupancy status.
     """
-    return db.get_occupancy_data()
+    return await adb.get_occupancy_data()
+
+@analytics_router.get("/dashboard", dependencies=[Depends(get_current_admin_user)])
+async def get_dashboard(request: Request, days: int = 30, query: AnalyticsQuery = Depends()):
+    """
+    The revenue, service-usage and occupancy charts in one response. The three
+    run concurrently, each on its own pooled connection, and the result is
+    shared by every admin for cache.DASHBOARD_CACHE_TTL seconds.
+    """
+    async def build():
+        if query.requested():
+            revenue, usage = query.series('revenue', days), query.series('bookings', days, group_by='service')
+        else:
+            revenue, usage = adb.get_revenue_data(days), adb.get_service_usage_data(days)
+        revenue, usage, occupancy = await asyncio.gather(revenue, usage, adb.get_occupancy_data())
+        return {"revenue": revenue, "services": usage, "occupancy": occupancy}, {}
+    return await cached_response(request, ("rooms", "services"), build, dashboard_cache)
 
 class RoomStatusUpdate(BaseModel):
     status: str
@@ -209,35 +667,199 @@ staff_router = APIRouter(
 # --- Rooms Routes (Admin Only) ---
 @rooms_router.get("/")
 async def get_all_rooms():
-    return db.get_rooms()
+    return TimedJSONResponse(await adb.get_rooms())
 
 @rooms_router.put("/{room_id}/status")
 async def update_room_status_endpoint(room_id: int, status_update: RoomStatusUpdate):
-    if not db.update_room_status(room_id, status_update.status):
+    if not await adb.update_room_status(room_id, status_update.status):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Room not found")
     return {"message": f"Room {room_id} status updated to {status_update.status}"}
 
 # --- Staff Routes (Admin Only) ---
 @staff_router.get("/")
 async def get_all_staff():
-    return db.get_staff()
+    return TimedJSONResponse(await adb.get_staff())
 
 @staff_router.post("/")
 async def create_new_staff(staff: StaffCreate):
-    staff_id = db.create_staff(staff.full_name, staff.specialty)
+    staff_id = await adb.create_staff(staff.full_name, staff.specialty)
     # Return the full staff object including the new ID
     return {"id": staff_id, **staff.dict()}
 
 
-app.include_router(services_router)
-app.include_router(bookings_router)
-app.include_router(staff_router)
-app.include_router(rooms_router)
-app.include_router(reviews_router)
-app.include_router(analytics_router)
+# --- Export Routes (Admin Only) ---
+exports_router = APIRouter(prefix="/exports", tags=["exports"], dependencies=[Depends(get_current_admin_user)])
+
+@exports_router.get("/{table}")
+async def export_table(
+    table: str,
+    format: str = Query("csv", description="csv or ndjson"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+):
+    """
+    Streams every bookings, payments or reviews row matching the filters as
+    CSV or NDJSON, in id order, without loading the table into memory.
+    """
+    if format not in exports.FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="format must be csv or ndjson")
+    try:
+        # Checks the filters before the response starts; the stream builds its own query
+        exports.build_query(table, date_from, date_to, status_filter)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    filename = f"{table}-{time.strftime('%Y-%m-%d')}.{format}"
+    return StreamingResponse(exports.stream(table, format, date_from, date_to, status_filter),
+                             media_type=exports.FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# --- Billing (Admin Only) ---
+billing_router = APIRouter(prefix="/billing", tags=["billing"], dependencies=[Depends(get_current_admin_user)])
+
+class BillingRun(BaseModel):
+    booking_ids: Optional[List[int]] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    status: Optional[str] = "completed"
+    payment_date: Optional[str] = None
+    dry_run: bool = False
+
+@billing_router.post("/run")
+async def run_billing(params: BillingRun):
+    """
+    Invoices the selected bookings that have no payment yet and records their
+    payments and product stock in one transaction; `dry_run` only previews.
+    """
+    try:
+        return await adb.run(billing.run, params.booking_ids, params.date_from, params.date_to,
+                             params.status, params.payment_date, params.dry_run)
+    except billing.InsufficientStock as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@billing_router.get("/invoices")
+async def get_invoices(booking_id: List[int] = Query(...)):
+    """Invoices for the given bookings (repeat booking_id), billed or not."""
+    if len(booking_id) > db.MAX_BULK_ITEMS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {db.MAX_BULK_ITEMS} bookings per request")
+    return TimedJSONResponse(await adb.run(billing.invoices, booking_id))
+
+# --- Live Event Stream ---
+EVENT_HEARTBEAT_SECONDS = 15
+
+async def get_stream_user(
+    request: Request,
+    token: Optional[str] = Query(None),
+    bearer: Optional[HTTPAuthorizationCredentials] = Depends(bearer_security),
+    credentials: Optional[HTTPBasicCredentials] = Depends(security),
+):
+    """Like get_current_user, but also takes the bearer token as ?token= since EventSource cannot set headers."""
+    if token:
+        return await _user_from_token(token)
+    return await get_current_user(request, bearer, credentials)
+
+def _event_visible(event: events.Event, user: dict) -> bool:
+    if user["isAdmin"] or event.topic == "resync":
+        return True
+    return event.topic.startswith("booking_") and event.data.get("user_id") == user["id"]
+
+@api_router.get("/events/stream")
+async def stream_events(current_user: dict = Depends(get_stream_user)):
+    """
+    Server-sent events carrying only changes: booking_created, booking_updated
+    and (for admins) room_status. Customers only receive their own bookings.
+    A resync event means the client missed events and should refetch.
+    """
+    async def event_source():
+        subscription = events.bus.subscribe()
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if _event_visible(event, current_user):
+                    yield f"id: {event.id}\nevent: {event.topic}\ndata: {json.dumps(event.data)}\n\n"
+        finally:
+            events.bus.unsubscribe(subscription)
+
+    return StreamingResponse(event_source(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Application Factory ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if app.state.settings.initialize_db:
+        await adb.run(db.initialize_db)
+    archiver = asyncio.create_task(archive.run_forever()) if app.state.settings.archive else None
+    yield
+    if archiver is not None:
+        archiver.cancel()
+        with suppress(asyncio.CancelledError):
+            await archiver
+    adb.shutdown()
+    hashing.pool.shutdown()
+    db.close()
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    Builds the application. The database, executor and hash pool settings are
+    process-wide, so a process serves one app at a time.
+    """
+    settings = settings or Settings()
+    db.configure_pool(path=settings.db_path, size=settings.pool_size, initialize=settings.initialize_db)
+    adb.configure(db_workers=settings.db_workers or db.POOL_SIZE)
+    if settings.hash_processes:
+        hashing.configure(processes=settings.hash_processes)
+
+    app = FastAPI(default_response_class=TimedJSONResponse, lifespan=lifespan)
+    app.state.settings = settings
+
+    # Added before CORS so that 429 responses still carry the CORS headers
+    global _limiter
+    _limiter = None
+    if settings.rate_limit:
+        _limiter = ratelimit.Limiter(ratelimit.DEFAULT_POLICIES if settings.rate_limits is None else settings.rate_limits)
+        app.add_middleware(RateLimitMiddleware, limiter=_limiter)
+
+    # --- CORS Middleware ---
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=list(settings.cors_origins),
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag"],
+    )
+    app.middleware("http")(record_request_metrics)
+    app.add_exception_handler(hashing.HashQueueFull, hash_queue_full_handler)
+
+    app.include_router(api_router)
+    app.include_router(services_router)
+    app.include_router(bookings_router)
+    app.include_router(staff_router)
+    app.include_router(rooms_router)
+    app.include_router(reviews_router)
+    app.include_router(analytics_router)
+    app.include_router(availability_router)
+    app.include_router(exports_router)
+    app.include_router(billing_router)
+    return app
+
+def __getattr__(name: str):
+    # `fast.app` (as in `uvicorn fast:app`) is built from the environment on first access
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Run the application ---
 if __name__ == "__main__":
-    db.initialize_db() # Ensure DB is ready on startup
+    import uvicorn
     # This block allows you to run the app directly with 'python fast.py'
     uvicorn.run("fast:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,97 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import metrics
+
+# bcrypt runs in a dedicated process pool so that hashing never competes with
+# request handling for the GIL. At most HASH_QUEUE_LIMIT hashes may be running
+# or waiting at once; beyond that callers are turned away immediately.
+HASH_PROCESSES = int(os.environ.get('HOTEL_HASH_PROCESSES', '2'))
+HASH_QUEUE_LIMIT = int(os.environ.get('HOTEL_HASH_QUEUE_LIMIT', '32'))
+HASH_RETRY_AFTER = int(os.environ.get('HOTEL_HASH_RETRY_AFTER', '2'))
+
+HASH_SECONDS = metrics.Histogram(
+    'hotel_password_hash_seconds', 'Time from submitting a password hash or check to its result.', ('operation',))
+HASH_REJECTED = metrics.Counter(
+    'hotel_password_hash_rejected_total', 'Password hashes refused because the hash queue was full.', ('operation',))
+
+class HashQueueFull(Exception):
+    """Raised when the password hashing queue is at its limit."""
+
+    def __init__(self, retry_after: int = HASH_RETRY_AFTER):
+        super().__init__("Too many password operations in progress, please retry shortly")
+        self.retry_after = retry_after
+
+_context = None
+
+def _get_context():
+    # passlib is only imported by the processes that actually hash
+    global _context
+    if _context is None:
+        from passlib.context import CryptContext
+        _context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _context
+
+def hash_password_sync(password: str) -> str:
+    return _get_context().hash(password)
+
+def verify_password_sync(plain_password: str, hashed_password: str) -> bool:
+    return _get_context().verify(plain_password, hashed_password)
+
+class HashPool:
+    """A process pool for password hashing with a bounded admission queue."""
+
+    def __init__(self, processes: int = HASH_PROCESSES, queue_limit: int = HASH_QUEUE_LIMIT):
+        self.processes = processes
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn keeps the worker processes free of the parent's threads and open connections
+            self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    async def run(self, operation: str, fn, *args):
+        with self._lock:
+            if self.pending >= self.queue_limit:
+                HASH_REJECTED.inc(operation=operation)
+                raise HashQueueFull()
+            self.pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+            HASH_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+pool = HashPool()
+
+metrics.Gauge('hotel_password_hash_queue_depth', 'Password hashes running or waiting in the hash pool.',
+              lambda: pool.pending)
+
+def configure(processes: Optional[int] = None, queue_limit: Optional[int] = None):
+    """Replaces the hash pool with one using the given limits."""
+    global pool
+    pool.shutdown()
+    pool = HashPool(processes or HASH_PROCESSES, queue_limit or HASH_QUEUE_LIMIT)
+
+async def hash_password(password: str) -> str:
+    return await pool.run('hash', hash_password_sync, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await pool.run('verify', verify_password_sync, plain_password, hashed_password)
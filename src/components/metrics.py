@@ -0,0 +1,108 @@
+import bisect
+import threading
+from typing import Callable, Dict, List, Tuple, Union
+
+# A small in-process metrics registry rendered in the Prometheus text format.
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(name, '') for name in self.labelnames), 0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f'{self.name}{_labels(self.labelnames, key)} {value}')
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # per-bucket counts (plus +Inf), then sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total) in self._series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                    lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+                lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {total}')
+                lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+class Gauge:
+    """
+    A metric whose current value(s) are read from a callback at scrape time.
+    Pass kind='counter' for monotonic totals kept elsewhere, e.g. pool checkouts.
+    """
+
+    def __init__(self, name: str, documentation: str,
+                 collect: Callable[[], Union[float, Dict[Tuple, float]]], labelnames: Tuple[str, ...] = (),
+                 kind: str = 'gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.labelnames = labelnames
+        self.kind = kind
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {value}')
+        return lines
+
+REGISTRY: List[Union[Counter, Histogram, Gauge]] = []
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
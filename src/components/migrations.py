@@ -0,0 +1,462 @@
+import sqlite3
+from typing import Callable, List, Tuple
+
+# Ordered (version, description, apply) entries. The schema version of a
+# database is kept in SQLite's user_version header field, so an existing
+# db.sqlite is upgraded in place by running only the entries it is missing.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = []
+
+def migration(version: int, description: str):
+    """Registers a migration; versions must be added in increasing order."""
+    def register(apply):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migration {version} is out of order")
+        MIGRATIONS.append((version, description, apply))
+        return apply
+    return register
+
+def current_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Applies every pending migration, each in its own IMMEDIATE transaction
+    together with the version bump, and returns the resulting version.
+    The version is re-read under the write lock so that several workers
+    starting at once apply each migration exactly once.
+    """
+    version = current_version(conn)
+    for target, description, apply in MIGRATIONS:
+        if target <= version:
+            continue
+        cur = conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            version = current_version(conn)
+            if target <= version:
+                conn.rollback()
+                continue
+            apply(cur)
+            cur.execute(f'PRAGMA user_version = {int(target)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    return version
+
+@migration(1, "Initial schema")
+def _initial_schema(cur: sqlite3.Cursor):
+    # --- People & Roles ---
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            full_name TEXT NOT NULL,
+            is_admin BOOLEAN DEFAULT 0
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER UNIQUE NOT NULL,
+            phone_number TEXT,
+            address TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS staff (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            specialty TEXT,
+            email TEXT UNIQUE,
+            phone_number TEXT
+        )
+    ''')
+
+    # --- Services & Products ---
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS service_categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            description TEXT
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS services (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category_id INTEGER,
+            name TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL,
+            status TEXT DEFAULT 'active',
+            FOREIGN KEY (category_id) REFERENCES service_categories (id)
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            price REAL NOT NULL,
+            stock INTEGER DEFAULT 0
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS staff_services (
+            staff_id INTEGER NOT NULL,
+            service_id INTEGER NOT NULL,
+            PRIMARY KEY (staff_id, service_id),
+            FOREIGN KEY (staff_id) REFERENCES staff (id),
+            FOREIGN KEY (service_id) REFERENCES services (id)
+        )
+    ''')
+
+    # --- Bookings & Hospitality ---
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS rooms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room_number TEXT UNIQUE NOT NULL,
+            type TEXT NOT NULL,
+            price_per_night REAL NOT NULL,
+            status TEXT DEFAULT 'available' -- available, occupied, maintenance
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            service_id INTEGER,
+            room_id INTEGER,
+            staff_id INTEGER,
+            date TEXT NOT NULL,
+            time TEXT,
+            status TEXT NOT NULL, -- pending, confirmed, completed, cancelled
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (service_id) REFERENCES services (id),
+            FOREIGN KEY (room_id) REFERENCES rooms (id),
+            FOREIGN KEY (staff_id) REFERENCES staff (id)
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS booking_products (
+            booking_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY (booking_id, product_id),
+            FOREIGN KEY (booking_id) REFERENCES bookings (id),
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+    ''')
+
+    # --- Financial & Feedback ---
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            booking_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            payment_date TEXT NOT NULL,
+            status TEXT DEFAULT 'completed',
+            FOREIGN KEY (booking_id) REFERENCES bookings (id)
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            booking_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            rating INTEGER NOT NULL,
+            comment TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (booking_id) REFERENCES bookings (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+@migration(2, "Secondary indexes for the booking, review and analytics queries")
+def _hot_query_indexes(cur: sqlite3.Cursor):
+    # get_bookings for a customer: WHERE user_id = ? ORDER BY date, id
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_user_date ON bookings (user_id, date)')
+    # get_bookings filtered by service
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_service_date ON bookings (service_id, date)')
+    # get_revenue_data: covers WHERE status = 'completed' AND date >= ? plus the join column
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_status_date_service ON bookings (status, date, service_id)')
+    # get_service_usage_data: covers WHERE date >= ? AND service_id IS NOT NULL
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_date_service ON bookings (date, service_id)')
+    # get_reviews: keyset on (created_at, id), optionally per author
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_reviews_created ON reviews (created_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_reviews_user_created ON reviews (user_id, created_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_reviews_booking ON reviews (booking_id)')
+    cur.execute('ANALYZE')
+
+@migration(3, "Daily per-service booking rollups maintained by triggers")
+def _daily_service_rollups(cur: sqlite3.Cursor):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS daily_service_stats (
+            date TEXT NOT NULL,
+            service_id INTEGER NOT NULL,
+            booking_count INTEGER NOT NULL DEFAULT 0,
+            completed_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (date, service_id)
+        ) WITHOUT ROWID
+    ''')
+    # The triggers run inside the statement that changes `bookings`, so the
+    # rollups commit or roll back together with the booking write itself.
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_rollup_insert
+        AFTER INSERT ON bookings WHEN NEW.service_id IS NOT NULL
+        BEGIN
+            INSERT INTO daily_service_stats (date, service_id, booking_count, completed_count)
+            VALUES (NEW.date, NEW.service_id, 1, NEW.status = 'completed')
+            ON CONFLICT (date, service_id) DO UPDATE SET
+                booking_count = booking_count + 1,
+                completed_count = completed_count + excluded.completed_count;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_rollup_update
+        AFTER UPDATE OF status, date, service_id ON bookings
+        BEGIN
+            UPDATE daily_service_stats SET
+                booking_count = booking_count - 1,
+                completed_count = completed_count - (OLD.status = 'completed')
+            WHERE date = OLD.date AND service_id = OLD.service_id;
+            INSERT INTO daily_service_stats (date, service_id, booking_count, completed_count)
+            SELECT NEW.date, NEW.service_id, 1, NEW.status = 'completed' WHERE NEW.service_id IS NOT NULL
+            ON CONFLICT (date, service_id) DO UPDATE SET
+                booking_count = booking_count + 1,
+                completed_count = completed_count + excluded.completed_count;
+        END
+    ''')
+    cur.execute('DELETE FROM daily_service_stats')
+    cur.execute('''
+        INSERT INTO daily_service_stats (date, service_id, booking_count, completed_count)
+        SELECT date, service_id, COUNT(*), SUM(status = 'completed')
+        FROM bookings WHERE service_id IS NOT NULL
+        GROUP BY date, service_id
+    ''')
+
+def _add_column(cur: sqlite3.Cursor, table: str, column: str, definition: str):
+    """ALTER TABLE ... ADD COLUMN that is a no-op when the column already exists."""
+    columns = {row[1] for row in cur.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        cur.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+@migration(4, "Room nights, service durations and availability indexes")
+def _availability(cur: sqlite3.Cursor):
+    _add_column(cur, 'bookings', 'nights', 'INTEGER NOT NULL DEFAULT 1')
+    _add_column(cur, 'services', 'duration_minutes', 'INTEGER NOT NULL DEFAULT 60')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_room_date ON bookings (room_id, date) WHERE room_id IS NOT NULL')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_staff_date ON bookings (staff_id, date) WHERE staff_id IS NOT NULL')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_staff_services_service ON staff_services (service_id, staff_id)')
+
+@migration(5, "Full-text search over reviews and services")
+def _full_text_search(cur: sqlite3.Cursor):
+    # Reviews are indexed as external content, so the comment text is stored once
+    cur.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts USING fts5(
+            comment, content='reviews', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_fts_insert AFTER INSERT ON reviews BEGIN
+            INSERT INTO reviews_fts (rowid, comment) VALUES (NEW.id, NEW.comment);
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_fts_delete AFTER DELETE ON reviews BEGIN
+            INSERT INTO reviews_fts (reviews_fts, rowid, comment) VALUES ('delete', OLD.id, OLD.comment);
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_fts_update AFTER UPDATE OF comment ON reviews BEGIN
+            INSERT INTO reviews_fts (reviews_fts, rowid, comment) VALUES ('delete', OLD.id, OLD.comment);
+            INSERT INTO reviews_fts (rowid, comment) VALUES (NEW.id, NEW.comment);
+        END
+    ''')
+    cur.execute("INSERT INTO reviews_fts (reviews_fts) VALUES ('rebuild')")
+
+    # Services carry their category name, which lives in another table, so
+    # this index keeps its own copy of the (small) text
+    cur.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS services_fts USING fts5(
+            name, description, category_name,
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    # Name matches outrank category matches, which outrank the description
+    cur.execute("INSERT INTO services_fts (services_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 5.0)')")
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_services_fts_insert AFTER INSERT ON services BEGIN
+            INSERT INTO services_fts (rowid, name, description, category_name)
+            VALUES (NEW.id, NEW.name, NEW.description,
+                    (SELECT name FROM service_categories WHERE id = NEW.category_id));
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_services_fts_delete AFTER DELETE ON services BEGIN
+            DELETE FROM services_fts WHERE rowid = OLD.id;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_services_fts_update
+        AFTER UPDATE OF name, description, category_id ON services BEGIN
+            UPDATE services_fts SET name = NEW.name, description = NEW.description,
+                category_name = (SELECT name FROM service_categories WHERE id = NEW.category_id)
+            WHERE rowid = NEW.id;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_service_categories_fts_update
+        AFTER UPDATE OF name ON service_categories BEGIN
+            UPDATE services_fts SET category_name = NEW.name
+            WHERE rowid IN (SELECT id FROM services WHERE category_id = NEW.id);
+        END
+    ''')
+    cur.execute('DELETE FROM services_fts')
+    cur.execute('''
+        INSERT INTO services_fts (rowid, name, description, category_name)
+        SELECT s.id, s.name, s.description, sc.name
+        FROM services s LEFT JOIN service_categories sc ON s.category_id = sc.id
+    ''')
+
+# Live tables whose old rows the archival job moves into <table>_archive
+ARCHIVED_TABLES = ('bookings', 'booking_products', 'payments', 'reviews')
+
+@migration(6, "Archive tables for old bookings and their payments, products and reviews")
+def _archive_tables(cur: sqlite3.Cursor):
+    # The archives copy the live column layout; a column added to a live table
+    # later must be added to its archive in the same migration
+    for table in ARCHIVED_TABLES:
+        cur.execute(f'CREATE TABLE IF NOT EXISTS {table}_archive AS SELECT * FROM {table} WHERE 0')
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_bookings_archive_id ON bookings_archive (id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_archive_date ON bookings_archive (date, id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_archive_user_date ON bookings_archive (user_id, date, id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_archive_service_date ON bookings_archive (service_id, date, id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_booking_products_archive_booking ON booking_products_archive (booking_id)')
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_archive_id ON payments_archive (id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_payments_archive_booking ON payments_archive (booking_id)')
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_reviews_archive_id ON reviews_archive (id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_reviews_archive_created ON reviews_archive (created_at, id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_reviews_archive_user_created ON reviews_archive (user_id, created_at, id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_reviews_archive_booking ON reviews_archive (booking_id)')
+    # The archival job moves child rows by booking
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_payments_booking ON payments (booking_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_booking_products_booking ON booking_products (booking_id)')
+    # Newest date (or timestamp) moved out of each table; reads from after it skip the archive
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS archive_horizons (
+            table_name TEXT PRIMARY KEY,
+            horizon TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+@migration(7, "Per-service rating aggregates maintained by triggers")
+def _service_ratings(cur: sqlite3.Cursor):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS service_ratings (
+            service_id INTEGER PRIMARY KEY,
+            review_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            rating_1 INTEGER NOT NULL DEFAULT 0,
+            rating_2 INTEGER NOT NULL DEFAULT 0,
+            rating_3 INTEGER NOT NULL DEFAULT 0,
+            rating_4 INTEGER NOT NULL DEFAULT 0,
+            rating_5 INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # db.get_top_rated_services orders by exactly this expression
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_service_ratings_average
+        ON service_ratings ((CAST(rating_sum AS REAL) / review_count) DESC, review_count DESC)
+        WHERE review_count > 0
+    ''')
+    # Like the booking rollups, the aggregates change in the statement that
+    # writes the review. Deletes (the archival job) leave them alone, so a
+    # service keeps the ratings of its archived reviews.
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_rating_insert AFTER INSERT ON reviews
+        BEGIN
+            INSERT INTO service_ratings (service_id, review_count, rating_sum,
+                                         rating_1, rating_2, rating_3, rating_4, rating_5)
+            SELECT b.service_id, 1, NEW.rating, NEW.rating = 1, NEW.rating = 2, NEW.rating = 3,
+                   NEW.rating = 4, NEW.rating = 5
+            FROM bookings b WHERE b.id = NEW.booking_id AND b.service_id IS NOT NULL
+            ON CONFLICT (service_id) DO UPDATE SET
+                review_count = review_count + 1,
+                rating_sum = rating_sum + excluded.rating_sum,
+                rating_1 = rating_1 + excluded.rating_1,
+                rating_2 = rating_2 + excluded.rating_2,
+                rating_3 = rating_3 + excluded.rating_3,
+                rating_4 = rating_4 + excluded.rating_4,
+                rating_5 = rating_5 + excluded.rating_5;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reviews_rating_update AFTER UPDATE OF rating, booking_id ON reviews
+        BEGIN
+            UPDATE service_ratings SET
+                review_count = review_count - 1,
+                rating_sum = rating_sum - OLD.rating,
+                rating_1 = rating_1 - (OLD.rating = 1),
+                rating_2 = rating_2 - (OLD.rating = 2),
+                rating_3 = rating_3 - (OLD.rating = 3),
+                rating_4 = rating_4 - (OLD.rating = 4),
+                rating_5 = rating_5 - (OLD.rating = 5)
+            WHERE service_id = (SELECT service_id FROM bookings WHERE id = OLD.booking_id);
+            INSERT INTO service_ratings (service_id, review_count, rating_sum,
+                                         rating_1, rating_2, rating_3, rating_4, rating_5)
+            SELECT b.service_id, 1, NEW.rating, NEW.rating = 1, NEW.rating = 2, NEW.rating = 3,
+                   NEW.rating = 4, NEW.rating = 5
+            FROM bookings b WHERE b.id = NEW.booking_id AND b.service_id IS NOT NULL
+            ON CONFLICT (service_id) DO UPDATE SET
+                review_count = review_count + 1,
+                rating_sum = rating_sum + excluded.rating_sum,
+                rating_1 = rating_1 + excluded.rating_1,
+                rating_2 = rating_2 + excluded.rating_2,
+                rating_3 = rating_3 + excluded.rating_3,
+                rating_4 = rating_4 + excluded.rating_4,
+                rating_5 = rating_5 + excluded.rating_5;
+        END
+    ''')
+    cur.execute('DELETE FROM service_ratings')
+    cur.execute('''
+        INSERT INTO service_ratings (service_id, review_count, rating_sum,
+                                     rating_1, rating_2, rating_3, rating_4, rating_5)
+        SELECT b.service_id, COUNT(*), SUM(r.rating), SUM(r.rating = 1), SUM(r.rating = 2),
+               SUM(r.rating = 3), SUM(r.rating = 4), SUM(r.rating = 5)
+        FROM (SELECT booking_id, rating FROM reviews
+              UNION ALL SELECT booking_id, rating FROM reviews_archive) r
+        JOIN (SELECT id, service_id FROM bookings
+              UNION ALL SELECT id, service_id FROM bookings_archive) b ON r.booking_id = b.id
+        WHERE b.service_id IS NOT NULL
+        GROUP BY b.service_id
+    ''')
+
+@migration(8, "Per-user bearer token revocation time")
+def _token_revocation(cur: sqlite3.Cursor):
+    _add_column(cur, 'users', 'tokens_revoked_before', 'REAL NOT NULL DEFAULT 0')
+
+@migration(9, "Longest stay per room, bounding the room conflict check")
+def _room_nights_index(cur: sqlite3.Cursor):
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_room_nights ON bookings (room_id, nights) WHERE room_id IS NOT NULL')
+
+@migration(10, "Generated secrets shared by every worker")
+def _app_secrets(cur: sqlite3.Cursor):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS app_secrets (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+@migration(11, "One (date, id, service_id) index instead of idx_bookings_date and idx_bookings_date_service")
+def _bookings_date_index(cur: sqlite3.Cursor):
+    # idx_bookings_date was a prefix of idx_bookings_date_service; this one index
+    # keeps the (date, id) order of the admin get_bookings keyset (so the merge
+    # with bookings_archive needs no sort) and still covers service_id
+    cur.execute('DROP INDEX IF EXISTS idx_bookings_date')
+    cur.execute('DROP INDEX IF EXISTS idx_bookings_date_service')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_bookings_date_id_service ON bookings (date, id, service_id)')
@@ -0,0 +1,109 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import metrics
+
+# Buckets are kept for at most MAX_CLIENTS clients per policy; the least
+# recently seen client is forgotten first (and starts again with a full bucket).
+MAX_CLIENTS = int(os.environ.get('HOTEL_RATE_LIMIT_MAX_CLIENTS', '100000'))
+
+RATE_LIMITED = metrics.Counter(
+    'hotel_rate_limited_total', 'Requests refused with 429, by policy and reason.', ('policy', 'reason'))
+
+class RatePolicy:
+    """
+    Limits for the routes under `prefix` (optionally only some methods):
+    a token bucket per client refilled at `rate` requests per second up to
+    `burst`, and optionally at most `max_concurrent` requests in flight
+    across all clients.
+    """
+
+    def __init__(self, name: str, prefix: str, rate: float, burst: int,
+                 methods: Optional[Tuple[str, ...]] = None, max_concurrent: Optional[int] = None):
+        self.name = name
+        self.prefix = prefix
+        self.rate = rate
+        self.burst = burst
+        self.methods = methods
+        self.max_concurrent = max_concurrent
+
+    def matches(self, method: str, path: str) -> bool:
+        return path.startswith(self.prefix) and (self.methods is None or method in self.methods)
+
+DEFAULT_POLICIES = (
+    RatePolicy('login', '/token', rate=1, burst=10, methods=('POST',)),
+    RatePolicy('create_booking', '/bookings', rate=5, burst=20, methods=('POST',)),
+    RatePolicy('analytics', '/analytics', rate=2, burst=10, max_concurrent=4),
+    RatePolicy('exports', '/exports', rate=0.1, burst=3, max_concurrent=2),
+)
+
+class TokenBuckets:
+    """Per-client token buckets for one policy, stored as (tokens, last refill) pairs."""
+
+    def __init__(self, rate: float, burst: int, max_clients: int = MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+
+    def take(self, client: str, now: Optional[float] = None) -> float:
+        """Takes a token for the client; returns 0 on success, else seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+class Limiter:
+    """
+    Applies the first matching policy to a request. Runs on the event loop
+    thread only, so the buckets and counters need no locking.
+    """
+
+    def __init__(self, policies=DEFAULT_POLICIES):
+        self.policies = tuple(policies)
+        self._buckets: Dict[str, TokenBuckets] = {
+            policy.name: TokenBuckets(policy.rate, policy.burst) for policy in self.policies}
+        self.in_flight: Dict[str, int] = {policy.name: 0 for policy in self.policies}
+
+    def match(self, method: str, path: str) -> Optional[RatePolicy]:
+        for policy in self.policies:
+            if policy.matches(method, path):
+                return policy
+        return None
+
+    def acquire(self, policy: RatePolicy, client: str) -> Optional[int]:
+        """
+        Admits a request, returning None, or returns the Retry-After seconds
+        for a 429. An admitted request under a concurrency limit must call
+        release() when it finishes.
+        """
+        wait = self._buckets[policy.name].take(client)
+        if wait:
+            RATE_LIMITED.inc(policy=policy.name, reason='rate')
+            return max(1, math.ceil(wait))
+        if policy.max_concurrent is not None:
+            if self.in_flight[policy.name] >= policy.max_concurrent:
+                RATE_LIMITED.inc(policy=policy.name, reason='concurrency')
+                return 1
+            self.in_flight[policy.name] += 1
+        return None
+
+    def release(self, policy: RatePolicy):
+        if policy.max_concurrent is not None:
+            self.in_flight[policy.name] -= 1
+
+    def stats(self) -> Dict[Tuple, float]:
+        return {(name,): count for name, count in self.in_flight.items()}
@@ -0,0 +1,75 @@
+import argparse
+import sqlite3
+from typing import List, Dict, Any
+import db
+
+# Rollups are kept in daily_service_stats by triggers on `bookings` (see
+# migration 3). Revenue is derived at read time from completed_count and the
+# current service price, which matches what the raw join reports. Archiving
+# deletes from `bookings` without touching the rollups, so the raw side here
+# is `bookings` together with `bookings_archive`.
+
+RAW_BOOKINGS = '(SELECT date, service_id, status FROM bookings UNION ALL SELECT date, service_id, status FROM bookings_archive)'
+
+REBUILD_SQL = '''
+    INSERT INTO daily_service_stats (date, service_id, booking_count, completed_count)
+    SELECT date, service_id, COUNT(*), SUM(status = 'completed')
+    FROM ''' + RAW_BOOKINGS + ''' WHERE service_id IS NOT NULL
+    GROUP BY date, service_id
+'''
+
+CHECK_SQL = '''
+    WITH raw AS (
+        SELECT date, service_id, COUNT(*) AS booking_count, SUM(status = 'completed') AS completed_count
+        FROM ''' + RAW_BOOKINGS + ''' WHERE service_id IS NOT NULL
+        GROUP BY date, service_id
+    ),
+    rolled AS (
+        SELECT date, service_id, booking_count, completed_count
+        FROM daily_service_stats WHERE booking_count != 0 OR completed_count != 0
+    )
+    SELECT rolled.date, rolled.service_id, rolled.booking_count, rolled.completed_count,
+           raw.booking_count AS raw_booking_count, raw.completed_count AS raw_completed_count
+    FROM rolled LEFT JOIN raw USING (date, service_id)
+    WHERE raw.booking_count IS NOT rolled.booking_count OR raw.completed_count IS NOT rolled.completed_count
+    UNION ALL
+    SELECT raw.date, raw.service_id, NULL, NULL, raw.booking_count, raw.completed_count
+    FROM raw LEFT JOIN rolled USING (date, service_id)
+    WHERE rolled.date IS NULL
+'''
+
+def rebuild(conn: sqlite3.Connection) -> int:
+    """Recomputes every rollup row from the live and archived bookings in one transaction."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM daily_service_stats')
+        count = conn.execute(REBUILD_SQL).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
+
+def check(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Returns every (date, service_id) whose rollup disagrees with the raw bookings."""
+    return [dict(row) for row in conn.execute(CHECK_SQL).fetchall()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the daily per-service analytics rollups.")
+    parser.add_argument('command', choices=['rebuild', 'check'])
+    parser.add_argument('--db', default=db.DB_PATH, help="path to the SQLite database")
+    args = parser.parse_args()
+
+    db.configure_pool(path=args.db)
+    with db.get_db() as conn:
+        if args.command == 'rebuild':
+            print(f"Rebuilt {rebuild(conn)} rollup rows")
+            return 0
+        mismatches = check(conn)
+    for row in mismatches:
+        print(row)
+    print(f"{len(mismatches)} mismatching rollup rows")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,60 @@
+import json
+from typing import Any, Dict, Iterator, List, Sequence
+
+# orjson is used when it is installed; the stdlib encoder is the fallback.
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+class Rows:
+    """
+    Query results as the column names plus the plain tuples the cursor
+    returned, so no sqlite3.Row objects are built. Encoding does build one
+    dict per row (zipping the tuple with the shared column names) right
+    before the encoder sees the list; the dicts are dropped once the body is
+    encoded. Splicing precomputed key fragments with one encoder call per
+    value measured slower than letting orjson encode the dicts. Iterating or
+    indexing also yields dicts, for Python callers.
+    """
+
+    __slots__ = ('columns', 'rows')
+
+    def __init__(self, columns: Sequence[str], rows: List[tuple]):
+        self.columns = tuple(columns)
+        self.rows = rows
+
+    @classmethod
+    def from_cursor(cls, cursor) -> 'Rows':
+        rows = cursor.fetchall()
+        return cls([column[0] for column in cursor.description or ()], rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        columns = self.columns
+        return (dict(zip(columns, row)) for row in self.rows)
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        return dict(zip(self.columns, self.rows[index]))
+
+    def value(self, index: int, column: str) -> Any:
+        return self.rows[index][self.columns.index(column)]
+
+    def slice(self, stop: int) -> 'Rows':
+        return Rows(self.columns, self.rows[:stop])
+
+def _default(value):
+    if isinstance(value, Rows):
+        # One dict per row; see Rows
+        return list(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(payload: Any) -> bytes:
+    """Compact JSON, with Rows encoded as a list of objects."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_default, separators=(',', ':'), ensure_ascii=False).encode()
@@ -0,0 +1,34 @@
+import os
+from dataclasses import dataclass, field
+from typing import Any, Optional, Tuple
+
+# 'basic' accepts HTTP Basic on every route next to bearer tokens; 'token'
+# only accepts Basic on POST /token, so bcrypt never runs on ordinary requests.
+AUTH_MODES = ('basic', 'token')
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+@dataclass
+class Settings:
+    """Configuration for one application instance; every field defaults to its HOTEL_* variable."""
+
+    db_path: str = field(default_factory=lambda: os.environ.get('HOTEL_DB_PATH', 'db.sqlite'))
+    pool_size: Optional[int] = field(default_factory=lambda: _env_int('HOTEL_DB_POOL_SIZE'))
+    db_workers: Optional[int] = field(default_factory=lambda: _env_int('HOTEL_DB_WORKERS'))
+    hash_processes: Optional[int] = field(default_factory=lambda: _env_int('HOTEL_HASH_PROCESSES'))
+    auth_mode: str = field(default_factory=lambda: os.environ.get('HOTEL_AUTH_MODE', 'basic'))
+    cors_origins: Tuple[str, ...] = field(default_factory=lambda: tuple(
+        os.environ.get('HOTEL_CORS_ORIGINS', 'http://localhost:3000,http://127.0.0.1:3000').split(',')))
+    # Migrate and seed the database in the startup hook
+    initialize_db: bool = True
+    rate_limit: bool = field(default_factory=lambda: os.environ.get('HOTEL_RATE_LIMIT', '1') != '0')
+    # ratelimit.RatePolicy instances; None means ratelimit.DEFAULT_POLICIES
+    rate_limits: Optional[Tuple[Any, ...]] = None
+    # Run the archival job (archive.py) in the background
+    archive: bool = field(default_factory=lambda: os.environ.get('HOTEL_ARCHIVE', '1') != '0')
+
+    def __post_init__(self):
+        if self.auth_mode not in AUTH_MODES:
+            raise ValueError(f"auth_mode must be one of {', '.join(AUTH_MODES)}")
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+import analytics
+import db
+
+class NullServiceTest(unittest.TestCase):
+    """Room-only bookings (service_id NULL) must not break the NumPy columns."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.previous_path = db.DB_PATH
+        db.configure_pool(path=os.path.join(self.tmp.name, 'test.sqlite'))
+        self.user_id = db.get_user_by_email('admin@gmail.com')['id']
+        self.engine = analytics.AnalyticsEngine()
+
+    def tearDown(self):
+        db.configure_pool(path=self.previous_path)
+        self.tmp.cleanup()
+
+    def bookings(self):
+        result = self.engine.series('bookings', '2024-01-01', '2024-01-31')
+        return result['summary']['total']
+
+    def test_room_only_bookings_are_skipped(self):
+        db.create_booking(self.user_id, 1, '2024-01-10', '10:00', status='completed')
+        room_only = db.create_booking(self.user_id, None, '2024-01-11', '10:00', room_id=1)
+        self.assertEqual(self.bookings(), 1)
+
+        # Loaded incrementally after the first refresh
+        db.create_booking(self.user_id, None, '2024-01-12', '10:00', room_id=1)
+        db.create_booking(self.user_id, 2, '2024-01-12', '11:00')
+        self.assertEqual(self.bookings(), 2)
+
+        # Re-read after a status change
+        db.update_booking_status(room_only, 'confirmed')
+        self.assertEqual(self.bookings(), 2)
+        self.assertEqual(self.engine.stats()['bookings_loaded'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+import availability
+import db
+
+class IntervalIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = availability.IntervalIndex()
+        self.hold = availability.Hold(1, 1, None, (100, 200), None)
+        self.index.add(100, 200, self.hold)
+        # A long stay elsewhere widens the scan, so the end comparison is exercised
+        self.index.add(5000, 6000, availability.Hold(9, 1, None, (5000, 6000), None))
+
+    def test_touching_intervals_do_not_overlap(self):
+        self.assertIsNone(self.index.find_overlap(200, 300))
+        self.assertIsNone(self.index.find_overlap(0, 100))
+
+    def test_overlaps_at_the_edges(self):
+        self.assertIs(self.index.find_overlap(199, 300), self.hold)
+        self.assertIs(self.index.find_overlap(0, 101), self.hold)
+        self.assertIs(self.index.find_overlap(150, 160), self.hold)
+        self.assertIs(self.index.find_overlap(0, 300), self.hold)
+
+    def test_long_interval_found_behind_later_starts(self):
+        index = availability.IntervalIndex()
+        long_stay = availability.Hold(2, 1, None, (0, 1000), None)
+        index.add(0, 1000, long_stay)
+        index.add(600, 700, availability.Hold(3, 1, None, (600, 700), None))
+        self.assertIs(index.find_overlap(900, 950), long_stay)
+
+    def test_removed_interval_frees_the_slot(self):
+        self.index.remove(100, self.hold)
+        self.assertIsNone(self.index.find_overlap(150, 160))
+        self.assertEqual(len(self.index), 1)
+
+class RoomSlotTest(unittest.TestCase):
+    """Check-out day is the next guest's check-in day, in the index and in SQL."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.previous_path = db.DB_PATH
+        db.configure_pool(path=os.path.join(self.tmp.name, 'test.sqlite'))
+        self.user_id = db.get_user_by_email('admin@gmail.com')['id']
+        self.engine = availability.AvailabilityEngine()
+
+    def tearDown(self):
+        db.configure_pool(path=self.previous_path)
+        self.tmp.cleanup()
+
+    def check(self, date, nights=1, time='10:00', room_id=1, staff_id=None):
+        with db.get_db() as conn:
+            availability.check_conflicts(conn, room_id, staff_id, 1, date, time, nights)
+
+    def test_same_day_check_out_and_check_in(self):
+        hold = self.engine.reserve(1, None, 1, '2024-05-01', '14:00', 3)
+        booking_id = db.create_booking(self.user_id, 1, '2024-05-01', '14:00', room_id=1, nights=3)
+        self.engine.confirm(hold, booking_id)
+        # Nights of May 1-3; May 4 is free
+        self.engine.reserve(1, None, 1, '2024-05-04', '14:00', 1)
+        self.check('2024-05-04')
+        self.check('2024-04-30')
+        with self.assertRaises(availability.BookingConflict):
+            self.engine.reserve(1, None, 1, '2024-05-03', '14:00', 1)
+        with self.assertRaises(availability.BookingConflict) as caught:
+            self.check('2024-05-03')
+        self.assertEqual(caught.exception.booking_id, booking_id)
+        with self.assertRaises(availability.BookingConflict):
+            self.check('2024-04-30', nights=2)
+
+    def test_staff_slot_ends_where_the_next_begins(self):
+        # Haircut lasts duration_minutes (60 by default)
+        db.create_booking(self.user_id, 1, '2024-05-01', '10:00', staff_id=1)
+        self.check('2024-05-01', time='11:00', room_id=None, staff_id=1)
+        self.check('2024-05-01', time='09:00', room_id=None, staff_id=1)
+        with self.assertRaises(availability.BookingConflict):
+            self.check('2024-05-01', time='10:59', room_id=None, staff_id=1)
+        with self.assertRaises(availability.BookingConflict):
+            self.check('2024-05-01', time='09:01', room_id=None, staff_id=1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+import billing
+import db
+
+class BillingRunTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.previous_path = db.DB_PATH
+        self.path = os.path.join(self.tmp.name, 'test.sqlite')
+        db.configure_pool(path=self.path)
+        user_id = db.get_user_by_email('admin@gmail.com')['id']
+        conn = sqlite3.connect(self.path)
+        conn.executemany('INSERT INTO products (name, price, stock) VALUES (?, ?, ?)',
+                         [('Shampoo', 12.5, 5), ('Serum', 20.0, 1)])
+        # Haircut (30.0) with two nights in room 101 (100.0) and two shampoos
+        self.haircut = conn.execute('''INSERT INTO bookings (user_id, service_id, room_id, date, time, nights, status)
+                                       VALUES (?, 1, 1, '2024-03-01', '10:00', 2, 'completed')''', (user_id,)).lastrowid
+        # Hair Coloring (75.0) and one serum
+        self.coloring = conn.execute('''INSERT INTO bookings (user_id, service_id, date, time, status)
+                                        VALUES (?, 2, '2024-03-02', '11:00', 'completed')''', (user_id,)).lastrowid
+        conn.executemany('INSERT INTO booking_products (booking_id, product_id, quantity) VALUES (?, ?, ?)',
+                         [(self.haircut, 1, 2), (self.coloring, 2, 1)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        db.configure_pool(path=self.previous_path)
+        self.tmp.cleanup()
+
+    def query(self, sql, params=()):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def stock(self):
+        return dict(self.query('SELECT name, stock FROM products WHERE name IN (?, ?)', ('Shampoo', 'Serum')))
+
+    def test_totals_payments_and_stock(self):
+        result = billing.run(booking_ids=[self.haircut, self.coloring], payment_date='2024-03-05')
+        totals = {invoice['booking_id']: invoice['total'] for invoice in result['invoices']}
+        self.assertEqual(totals, {self.haircut: 30.0 + 2 * 100.0 + 2 * 12.5, self.coloring: 75.0 + 20.0})
+        self.assertEqual(result['total'], 350.0)
+        self.assertEqual(self.query('SELECT booking_id, amount, payment_date FROM payments ORDER BY booking_id'),
+                         [(self.haircut, 255.0, '2024-03-05'), (self.coloring, 95.0, '2024-03-05')])
+        self.assertEqual(self.stock(), {'Shampoo': 3, 'Serum': 0})
+        # Billed bookings are never billed again
+        self.assertEqual(billing.run(booking_ids=[self.haircut, self.coloring])['bookings'], 0)
+        self.assertEqual(self.stock(), {'Shampoo': 3, 'Serum': 0})
+
+    def test_dry_run_writes_nothing(self):
+        result = billing.run(booking_ids=[self.haircut, self.coloring], dry_run=True)
+        self.assertEqual(result['total'], 350.0)
+        self.assertEqual(self.query('SELECT COUNT(*) FROM payments'), [(0,)])
+        self.assertEqual(self.stock(), {'Shampoo': 5, 'Serum': 1})
+
+    def test_shortage_bills_nothing(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute('INSERT INTO booking_products (booking_id, product_id, quantity) VALUES (?, 2, 1)', (self.haircut,))
+        conn.commit()
+        conn.close()
+        with self.assertRaises(billing.InsufficientStock) as caught:
+            billing.run(booking_ids=[self.haircut, self.coloring])
+        self.assertEqual([(item['name'], item['quantity'], item['stock']) for item in caught.exception.shortages],
+                         [('Serum', 2, 1)])
+        self.assertEqual(self.query('SELECT COUNT(*) FROM payments'), [(0,)])
+        self.assertEqual(self.stock(), {'Shampoo': 5, 'Serum': 1})
+
+if __name__ == '__main__':
+    unittest.main()
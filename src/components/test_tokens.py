@@ -0,0 +1,71 @@
+import base64
+import json
+import os
+import tempfile
+import unittest
+import db
+import tokens
+
+class TokenTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.previous_path = db.DB_PATH
+        db.configure_pool(path=os.path.join(self.tmp.name, 'test.sqlite'))
+        self.user = db.get_user_by_email('admin@gmail.com')
+        tokens._revoked_before.clear()
+
+    def tearDown(self):
+        db.configure_pool(path=self.previous_path)
+        tokens._revoked_before.clear()
+        self.tmp.cleanup()
+
+    def token(self, **kwargs) -> str:
+        return tokens.issue_token(self.user, **kwargs)["access_token"]
+
+    def authenticate(self, token: str):
+        """What bearer auth does: signature and expiry, then the revocation time."""
+        claims = tokens.verify_token(token)
+        revoked_before = tokens.cached_revoked_before(claims["sub"])
+        if revoked_before is None:
+            revoked_before = tokens.load_revoked_before(claims["sub"])
+        tokens.check_revoked(claims, revoked_before)
+        return claims
+
+    def test_valid_token(self):
+        claims = self.authenticate(self.token())
+        self.assertEqual(claims["sub"], self.user["id"])
+        self.assertTrue(claims["adm"])
+
+    def test_forged_claims_are_rejected(self):
+        payload, _, signature = self.token().partition('.')
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        claims["sub"] = claims["sub"] + 1
+        forged = tokens._b64encode(json.dumps(claims, separators=(',', ':')).encode())
+        for token in (f"{forged}.{signature}", f"{payload}.{signature[:-2]}xx", payload, "not a token"):
+            with self.assertRaises(tokens.InvalidToken):
+                tokens.verify_token(token)
+
+    def test_expired_token_is_rejected(self):
+        with self.assertRaisesRegex(tokens.InvalidToken, "expired"):
+            tokens.verify_token(self.token(ttl=-1))
+
+    def test_password_change_revokes_earlier_tokens(self):
+        old = self.token()
+        # What PUT /users/me/password does after storing the new hash
+        db.update_user_password(self.user["id"], "new hash")
+        tokens.revoke_user_tokens(self.user["id"])
+        with self.assertRaisesRegex(tokens.InvalidToken, "revoked"):
+            self.authenticate(old)
+        # Another worker, with nothing cached, reads the revocation from the database
+        tokens._revoked_before.clear()
+        with self.assertRaisesRegex(tokens.InvalidToken, "revoked"):
+            self.authenticate(old)
+        self.authenticate(self.token())
+
+    def test_secret_is_shared_through_the_database(self):
+        token = self.token()
+        tokens._secrets.clear()
+        self.authenticate(token)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+import writer
+
+class GroupCommitWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'test.sqlite')
+        conn = sqlite3.connect(self.path)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)')
+        conn.close()
+        # A long flush window puts everything submitted below into one batch
+        self.writer = writer.GroupCommitWriter(lambda: sqlite3.connect(self.path, check_same_thread=False),
+                                               flush_ms=500)
+
+    def tearDown(self):
+        self.writer.close()
+        self.tmp.cleanup()
+
+    def names(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return [row[0] for row in conn.execute('SELECT name FROM items ORDER BY id')]
+        finally:
+            conn.close()
+
+    def insert(self, name):
+        return lambda conn: conn.execute('INSERT INTO items (name) VALUES (?)', (name,)).lastrowid
+
+    def test_failing_operation_is_rolled_back_alone(self):
+        def half_done(conn):
+            conn.execute('INSERT INTO items (name) VALUES (?)', ('partial',))
+            raise ValueError("rejected")
+        futures = [self.writer.submit(op) for op in
+                   (self.insert('first'), half_done, self.insert('first'), self.insert('last'))]
+        self.assertEqual(futures[0].result(5), 1)
+        with self.assertRaises(ValueError):
+            futures[1].result(5)
+        # The duplicate violates UNIQUE; its savepoint is rolled back, not the batch
+        with self.assertRaises(sqlite3.IntegrityError):
+            futures[2].result(5)
+        self.assertIsNotNone(futures[3].result(5))
+        self.assertEqual(self.names(), ['first', 'last'])
+
+    def test_results_are_delivered_after_commit(self):
+        release = threading.Event()
+        seen = {}
+        first = self.writer.submit(self.insert('first'))
+
+        def later(conn):
+            # Runs in the same batch, after `first`, before the COMMIT
+            seen['first_done'] = first.done()
+            seen['visible'] = self.names()
+            release.wait(5)
+            return 'later'
+        second = self.writer.submit(later)
+        release.set()
+        self.assertEqual(second.result(5), 'later')
+        self.assertFalse(seen['first_done'])
+        self.assertEqual(seen['visible'], [])
+        # Once the result is out, the row is visible to other connections
+        self.assertEqual(first.result(5), 1)
+        self.assertEqual(self.names(), ['first'])
+
+    def test_closed_writer_rejects_writes(self):
+        self.writer.close()
+        with self.assertRaises(writer.WriterClosed):
+            self.writer.submit(self.insert('late'))
+
+if __name__ == '__main__':
+    unittest.main()
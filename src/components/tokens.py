@@ -0,0 +1,113 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+import db
+
+# Every worker that should accept the same tokens must share the signing
+# secret: HOTEL_TOKEN_SECRET if set, else a random one generated once and
+# stored in the database (app_secrets), so tokens survive restarts and are
+# accepted by every worker using the same database file.
+TOKEN_SECRET_ENV = os.environ.get('HOTEL_TOKEN_SECRET')
+TOKEN_TTL_SECONDS = int(os.environ.get('HOTEL_TOKEN_TTL', '3600'))
+# Revocations live in users.tokens_revoked_before, so every worker honours
+# them; each worker caches a user's value for this long, which is how late a
+# revocation made by another worker can take effect.
+REVOCATION_CACHE_SECONDS = float(os.environ.get('HOTEL_TOKEN_REVOCATION_CACHE_SECONDS', '5'))
+
+class InvalidToken(Exception):
+    """Raised when a bearer token is malformed, forged, expired or revoked."""
+
+# user id -> (time before which the user's tokens are rejected, when it was read)
+_revoked_before: Dict[int, Tuple[float, float]] = {}
+_revoked_lock = threading.Lock()
+
+# database path -> signing secret read from it
+_secrets: Dict[str, bytes] = {}
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+def _secret() -> bytes:
+    if TOKEN_SECRET_ENV:
+        return TOKEN_SECRET_ENV.encode()
+    secret = _secrets.get(db.DB_PATH)
+    if secret is None:
+        secret = _secrets[db.DB_PATH] = db.get_token_secret().encode()
+    return secret
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_secret(), payload.encode('ascii'), hashlib.sha256).digest())
+
+def issue_token(user: Dict[str, Any], ttl: int = TOKEN_TTL_SECONDS) -> Dict[str, Any]:
+    """Creates a signed, expiring bearer token carrying the user's id and admin flag."""
+    now = time.time()
+    claims = {
+        "sub": user["id"],
+        "email": user["email"],
+        "name": user.get("full_name"),
+        "adm": bool(user.get("is_admin")),
+        "iat": now,
+        "exp": now + ttl,
+    }
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    return {"access_token": f"{payload}.{_sign(payload)}", "token_type": "bearer", "expires_in": ttl}
+
+def verify_token(token: str) -> Dict[str, Any]:
+    """
+    Checks a token's signature and expiry and returns its claims. Revocation
+    is checked separately with check_revoked(). No password hashing and no
+    database access is involved.
+    """
+    payload, sep, signature = token.partition('.')
+    try:
+        valid = bool(sep) and hmac.compare_digest(signature.encode('ascii'), _sign(payload).encode('ascii'))
+    except UnicodeEncodeError:
+        valid = False
+    if not valid:
+        raise InvalidToken("Invalid token signature")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise InvalidToken("Malformed token")
+    if claims["exp"] < time.time():
+        raise InvalidToken("Token has expired")
+    return claims
+
+def cached_revoked_before(user_id: int) -> Optional[float]:
+    """The user's revocation time if cached recently enough, else None (call load_revoked_before)."""
+    cached = _revoked_before.get(user_id)
+    if cached is None or time.monotonic() - cached[1] > REVOCATION_CACHE_SECONDS:
+        return None
+    return cached[0]
+
+def load_revoked_before(user_id: int) -> float:
+    """Reads the user's revocation time from the database and caches it; blocking."""
+    revoked_before = db.get_tokens_revoked_before(user_id)
+    if revoked_before is None:
+        # The user no longer exists
+        revoked_before = float('inf')
+    with _revoked_lock:
+        _revoked_before[user_id] = (revoked_before, time.monotonic())
+    return revoked_before
+
+def check_revoked(claims: Dict[str, Any], revoked_before: float):
+    if claims["iat"] < revoked_before:
+        raise InvalidToken("Token has been revoked")
+
+def revoke_user_tokens(user_id: int):
+    """
+    Invalidates every token issued to a user so far, e.g. after a password or
+    role change. Blocking: the time is written to the users table.
+    """
+    now = time.time()
+    db.set_tokens_revoked_before(user_id, now)
+    with _revoked_lock:
+        _revoked_before[user_id] = (now, time.monotonic())